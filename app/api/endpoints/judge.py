@@ -1,313 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from sqlmodel import Session, select
+from fastapi import APIRouter, Depends, HTTPException
+from sqlmodel import Session
 from app.core.database import get_session
 from app.core.security import get_current_user
 from app.core.config import settings
-from app.core.leaderboard import leaderboard_service
-from app.models import Submission, User, SubmissionStatus, Problem, UserScore
-from datetime import datetime
-from typing import List
-import subprocess
-import os
-import tempfile
-import shutil
+from app.core import judge_queue
+from app.core.judge import update_user_score
+from app.core.problem_cache import problem_cache
+from app.core.verdict_cache import verdict_cache, code_hash, copy_test_results
+from app.core.metrics import VERDICT_CACHE_HITS
+from app.models import Submission, User, Problem
+from datetime import datetime, timezone
+from typing import Dict
+import json
 
 router = APIRouter()
 
-# Constants from judge.py
-BOX_ID = "0"
-MEMORY_LIMIT = "64000"  # 64 MB
-TIME_LIMIT = "0.1"  # 0.1s
-SANDB0X_PATH = f'/var/local/lib/isolate/{BOX_ID}/box/'
-
-def classify_traceback(path: str):
-    """Classifies a Python traceback and sanitizes it"""
-    try:
-        with open(path, 'r') as f:
-            tb = f.read()
-    except FileNotFoundError:
-        return {"status": "RE", "traceback": "Error file not found"}
-
-    tb_lower = tb.lower()
-    
-    memory_signatures = [
-        "memoryerror",
-        "cannot allocate memory",
-        "out of memory",
-        "oom",
-    ]
-
-    # Only consider it MLE if we have explicit memory error keywords
-    # Don't rely solely on "killed" as that could be from time limit
-    if any(sig in tb_lower for sig in memory_signatures):
-        return {"status": "MLE"}
-
-    lines = tb.strip().splitlines()
-    filtered = []
-
-    for line in lines:
-        if "solution.py" in line:
-            filtered.append(line)
-
-    error_line = lines[-1] if lines else ""
-    if error_line and error_line not in filtered:
-        filtered.append(error_line)
-
-    sanitized = "\n".join(filtered).strip()
-    
-    return {
-        "status": "RE",
-        "traceback": sanitized
-    }
-
-def run_judge(submission_id: int, problem_path: str, code: str, session: Session):
-    """Run the judge on a submission"""
-    import logging
-    logger = logging.getLogger(__name__)
-    
-    # Ensure problem_path is absolute
-    from pathlib import Path
-    problem_path = str(Path(problem_path).resolve())
-    
-    logger.info(f"Starting judge for submission {submission_id}")
-    logger.info(f"Problem path: {problem_path}")
-    
-    TEST_CASES_PATH = f"{problem_path}/test_cases/"
-    OUTPUT_PATH = f"{problem_path}/output/"
-    EXPECTED_PATH = f"{problem_path}/expected/"
-    ERROR_PATH = f"{problem_path}/error/"
-    META_PATH = f"{problem_path}/meta/"
-    PROBLEM_FILE = 'run.py'
-    
-    # Create necessary directories
-    os.makedirs(OUTPUT_PATH, exist_ok=True)
-    os.makedirs(ERROR_PATH, exist_ok=True)
-    os.makedirs(META_PATH, exist_ok=True)
-    
-    test_cases = []
-    all_accepted = True
-    
-    # Check if isolate is installed
-    try:
-        isolate_check = subprocess.run(['which', 'isolate'], capture_output=True, text=True)
-        if isolate_check.returncode != 0:
-            logger.error("isolate command not found!")
-            submission = session.get(Submission, submission_id)
-            submission.status = SubmissionStatus.INTERNAL_ERR
-            submission.result = "Judge system not configured (isolate not installed)"
-            session.commit()
-            return
-        logger.info(f"isolate found at: {isolate_check.stdout.strip()}")
-    except Exception as e:
-        logger.error(f"Error checking for isolate: {e}")
-    
-    # Check if test cases directory exists
-    if not os.path.exists(TEST_CASES_PATH):
-        logger.error(f"Test cases directory not found: {TEST_CASES_PATH}")
-        submission = session.get(Submission, submission_id)
-        submission.status = SubmissionStatus.INTERNAL_ERR
-        submission.result = "Test cases directory not found"
-        session.commit()
-        return
-    
-    logger.info(f"Test cases directory found: {TEST_CASES_PATH}")
-    
-    # Create a temporary solution file
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False) as temp_solution:
-        temp_solution.write(code)
-        temp_solution_path = temp_solution.name
-    
-    try:
-        for test_file in os.scandir(TEST_CASES_PATH):
-            if not test_file.is_file():
-                continue
-                
-            return_dict = {}
-            
-            # Sandbox cleanup
-            subprocess.run(['isolate', '--box-id=0', '--cleanup'], 
-                         capture_output=True, check=False)
-            
-            # Initialize sandbox
-            subprocess.run(['isolate', f"--box-id={BOX_ID}", '--init'],
-                         capture_output=True, check=False)
-            
-            # Copy solution file to sandbox
-            subprocess.run(['cp', temp_solution_path, f"{SANDB0X_PATH}solution.py"],
-                         capture_output=True, check=False)
-            
-            # Copy problem file to sandbox
-            if os.path.exists(f'{problem_path}/{PROBLEM_FILE}'):
-                subprocess.run(['cp', f'{problem_path}/{PROBLEM_FILE}', SANDB0X_PATH],
-                             capture_output=True, check=False)
-            
-            # Copy test case input to sandbox
-            subprocess.run(['cp', test_file.path, f'{SANDB0X_PATH}stdin.txt'],
-                         check=False)
-            
-            # Create output and error files
-            subprocess.run(['touch', f'{SANDB0X_PATH}stdout.txt'], check=False)
-            subprocess.run(['touch', f'{SANDB0X_PATH}stderr.txt'], check=False)
-            
-            # Run python file with constraints
-            output = subprocess.run([
-                'isolate', 
-                f"--box-id={BOX_ID}",
-                '--processes=1',
-                '--stdin=./stdin.txt',
-                '--stdout=./stdout.txt',
-                '--stderr=./stderr.txt',
-                f'--time={TIME_LIMIT}',
-                f'--mem={MEMORY_LIMIT}',
-                f'--meta={META_PATH}{test_file.name}',
-                '--run',
-                '--', 
-                '/usr/bin/python3', 
-                PROBLEM_FILE
-            ], capture_output=True, text=True)
-            
-            # Parse execution metadata
-            meta = {}
-            try:
-                with open(f"{META_PATH}{test_file.name}", 'r', encoding='utf-8') as meta_file:
-                    for line in meta_file.read().split('\n'):
-                        if line.strip() and ':' in line:
-                            key, value = line.split(':', 1)
-                            meta[key] = value
-            except FileNotFoundError:
-                meta = {'status': 'XX'}
-            
-            return_dict["mem"] = round(float(meta.get("max-rss", 0))/1000, 2)
-            return_dict["time"] = round(float(meta.get("time", 0)), 3)
-            
-            # Copy output files from sandbox
-            subprocess.run(['cp', f'{SANDB0X_PATH}stdout.txt', 
-                          f'{OUTPUT_PATH}/{test_file.name}'], check=False)
-            subprocess.run(['cp', f'{SANDB0X_PATH}stderr.txt', 
-                          f'{ERROR_PATH}/{test_file.name}'], check=False)
-            
-            # Process execution result
-            if output.returncode == 0:
-                try:
-                    with open(f"{EXPECTED_PATH}{test_file.name}", 'r', 
-                            encoding='utf-8') as expected_file:
-                        expected_result = expected_file.read()
-                    
-                    with open(f"{OUTPUT_PATH}{test_file.name}", 'r', 
-                            encoding='utf-8') as output_file:
-                        output_result = output_file.read()
-                    
-                    if expected_result.strip() == output_result.strip():
-                        return_dict["status"] = "AC"
-                    else:
-                        return_dict["status"] = "WA"
-                        all_accepted = False
-                except FileNotFoundError:
-                    return_dict["status"] = "XX"
-                    all_accepted = False
-            else:
-                # Non-zero return code - check meta status first
-                meta_status = meta.get('status', '')
-                
-                # Handle time limit exceeded
-                if meta_status == "TO":
-                    return_dict["status"] = "TO"
-                    all_accepted = False
-                # Handle internal/sandbox errors
-                elif meta_status == "XX":
-                    return_dict["status"] = "XX"
-                    all_accepted = False
-                # Handle runtime errors and memory limit errors
-                else:
-                    # Check stderr for error details
-                    error_result = classify_traceback(f"{ERROR_PATH}{test_file.name}")
-                    return_dict.update(error_result)
-                    all_accepted = False
-            
-            test_cases.append(return_dict)
-            
-            # If any test case fails, we can break early (optional)
-            if not all_accepted and return_dict["status"] != "AC":
-                break
-    
-    finally:
-        # Cleanup temporary solution file
-        if os.path.exists(temp_solution_path):
-            os.remove(temp_solution_path)
-        
-        # Final sandbox cleanup
-        subprocess.run(['isolate', '--box-id=0', '--cleanup'], 
-                     capture_output=True, check=False)
-  #~~~ UPDATED SECTION ~~~#
-  # Score calculation and leaderboard updates
-
-    # Get submission and problem details
-    submission = session.get(Submission, submission_id)
-    if not submission:
-        logger.error(f"Submission {submission_id} not found in database")
-        return
-    
-    # Get problem to determine max score
-    problem = session.get(Problem, submission.problem_id)
-    max_score = problem.max_score if problem else 100
-    
-    # Calculate score based on test results
-    score = calculate_scores(test_cases, max_score)
-    
-    # Update submission with score and status
-    submission.score = score  # Add the score field
-    
-    if all_accepted and test_cases:
-        submission.status = SubmissionStatus.ACCEPTED
-        submission.result = f"All {len(test_cases)} test cases passed - Score: {score}/{max_score}"
-    elif test_cases:
-        # Set status based on first failure
-        first_failure = next((tc for tc in test_cases if tc["status"] != "AC"), None)
-        if first_failure:
-            status_map = {
-                "WA": SubmissionStatus.WRONG_ANS,
-                "TO": SubmissionStatus.TIME_LIMIT,
-                "MLE": SubmissionStatus.MEM_LIMIT,
-                "RE": SubmissionStatus.RUNTIME_ERR,
-                "XX": SubmissionStatus.INTERNAL_ERR
-            }
-            submission.status = status_map.get(first_failure["status"], SubmissionStatus.RUNTIME_ERR)
-            submission.result = first_failure.get("traceback", 
-                               f"Failed on test case with status {first_failure['status']} - Score: {score}/{max_score}")
-    else:
-        submission.status = SubmissionStatus.INTERNAL_ERR
-        submission.result = "No test cases found"
-    
-    # Commit submission changes first
-    session.commit()
-    session.refresh(submission)
-    
-    # Update user score and leaderboard
-    try:
-        # Try to run the async update
-        import asyncio
-        loop = asyncio.get_event_loop()
-        if loop.is_running():
-            # If loop is running, create a task
-            asyncio.create_task(
-                update_user_score(session, submission.user_id, submission.problem_id, score)
-            )
-        else:
-            # If no loop is running, run it directly
-            loop.run_until_complete(
-                update_user_score(session, submission.user_id, submission.problem_id, score)
-            )
-    except Exception as e:
-        logger.error(f"Async score update failed: {e}")
-        # Fallback to synchronous update
-        update_user_score_sync(session, submission.user_id, submission.problem_id, score)
-    
-    logger.info(f"Judging completed for submission {submission_id}. Score: {score}/{max_score}, Status: {submission.status}")
-
 @router.post("/{submission_id}/judge")
-async def judge_submission(
+def judge_submission(
     submission_id: int,
-    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_user),
     session: Session = Depends(get_session)
 ):
@@ -326,10 +36,6 @@ async def judge_submission(
     if not problem:
         raise HTTPException(status_code=404, detail="Problem not found")
     
-    # Update status to pending
-    submission.status = SubmissionStatus.PENDING
-    session.commit()
-    
     # Get problem path from config
     problem_path = settings.get_problem_path(submission.problem_id)
     
@@ -338,21 +44,50 @@ async def judge_submission(
             status_code=404, 
             detail=f"Problem directory not found: {problem_path}"
         )
+
+    # Lock the row until this request commits, so no worker claims it meanwhile,
+    # and leave a run in progress alone (re-queuing would let a second worker in)
+    session.refresh(submission, with_for_update=True)
+    if judge_queue.running(submission):
+        raise HTTPException(status_code=409, detail="Submission is already being judged")
+
+    # Identical code for an unchanged problem gets the stored verdict right away
+    if settings.VERDICT_CACHE_ENABLED:
+        try:
+            version = problem_cache.get(problem_path).version
+        except (FileNotFoundError, ValueError):
+            version = None  # let the judge report the broken problem
+        
+        digest = code_hash(submission.code)
+        cached = version and verdict_cache.lookup(session, submission.problem_id, version, digest)
+        if cached:
+            submission.status = cached.status
+            submission.score = cached.score
+            submission.result = cached.result
+            submission.code_hash = digest
+            submission.problem_version = version
+            submission.queued_at = None
+            # no judge run of its own, so no timeline; the per-test results are the cached run's
+            submission.trace = None
+            session.add(submission)
+            copy_test_results(session, cached.submission_id, submission.submission_id)
+            session.commit()
+            
+            # the change reaches every API process, this one included, through the pub/sub
+            update_user_score(session, submission.user_id, submission.problem_id, cached.score)
+            VERDICT_CACHE_HITS.inc(problem_id=submission.problem_id)
+            
+            return {
+                "message": "Submission judged (same as an earlier submission)",
+                "submission_id": submission_id,
+                "status": cached.status
+            }
     
-    # Convert to string for the judge function - THIS WAS THE BUG!
-    problem_path_str = str(problem_path)
-    
-    # Run judge in background - use problem_path_str, not problem_path
-    background_tasks.add_task(
-        run_judge, 
-        submission_id, 
-        problem_path_str,  # Fixed: was passing problem_path (Path object)
-        submission.code,
-        session
-    )
+    # Hand the submission to the judge queue; a judge worker picks it up
+    judge_queue.enqueue(session, submission)
     
     return {
-        "message": "Submission is being judged",
+        "message": "Submission queued for judging",
         "submission_id": submission_id,
         "status": "PENDING"
     }
@@ -380,69 +115,55 @@ def get_submission_status(
         "submitted_at": submission.submitted_at
     }
 
-#~~~ FUNCTIONS RELATED TO SCORE CALCULATION ~~~#
-# if all test cases pass -> 100; otherwise -> 0 
-def calculate_scores(test_cases:List[dict], problem_max_score:int) -> int:
-    if not test_cases:
-        return 0
-    
-    all_passed = all(tc.get("status") == "AC" for tc in test_cases)
 
-    if all_passed:
-        return problem_max_score    #maybe different problems have different scores assigned to them :)
-    else:
-        return 0
-
-async def update_user_score(session: Session, user_id: int, problem_id: int, new_score: int):
-    # get existing user score
-    existing_score = session.exec(
-        select(UserScore).where(
-            UserScore.user_id == user_id,
-            UserScore.problem_id == problem_id
-        )
-    ).first()
-    
-    if existing_score:
-        # update if new score is better
-        if new_score > existing_score.best_score:
-            existing_score.best_score = new_score
-            existing_score.last_updated = datetime.utcnow()
-            session.add(existing_score)
-    else:
-        # new user score
-        user_score = UserScore(
-            user_id=user_id,
-            problem_id=problem_id,
-            best_score=new_score
-        )
-        session.add(user_score)
+@router.get("/{submission_id}/trace")
+def get_submission_trace(
+    submission_id: int,
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
+):
+    """Get the timeline of the last judge run of a submission"""
     
-    session.commit()
+    submission = session.get(Submission, submission_id)
+    if not submission:
+        raise HTTPException(status_code=404, detail="Submission not found")
     
-    # broadcast updated leaderboard to all connected clients
-    await leaderboard_service.broadcast_leaderboard(session)
-
-# Add synchronous version for fallback
-def update_user_score_sync(session: Session, user_id: int, problem_id: int, new_score: int):
-    existing_score = session.exec(
-        select(UserScore).where(
-            UserScore.user_id == user_id,
-            UserScore.problem_id == problem_id
-        )
-    ).first()
+    if submission.user_id != current_user.user_id:
+        raise HTTPException(status_code=403, detail="Not authorized")
     
-    if existing_score:
-        if new_score > existing_score.best_score:
-            existing_score.best_score = new_score
-            existing_score.last_updated = datetime.utcnow()
-            session.add(existing_score)
-    else:
-        user_score = UserScore(
-            user_id=user_id,
-            problem_id=problem_id,
-            best_score=new_score
-        )
-        session.add(user_score)
+    if not submission.trace:
+        raise HTTPException(status_code=404, detail="No trace recorded for this submission")
+    
+    trace = json.loads(submission.trace)
+    spans = [
+        {
+            "name": span[0],
+            "detail": span[3] if len(span) > 3 else None,
+            "start_ms": span[1],
+            "duration_ms": span[2],
+        }
+        for span in trace["spans"]
+    ]
+    total_ms = max((span["start_ms"] + span["duration_ms"] for span in spans), default=0)
+    
+    # time per kind of span; spans of parallel boxes (and "score", which runs
+    # inside "db_commit") overlap, so shares can add up to more than 100%
+    totals: Dict[str, float] = {}
+    for span in spans:
+        totals[span["name"]] = totals.get(span["name"], 0) + span["duration_ms"]
+    breakdown = [
+        {
+            "name": name,
+            "total_ms": round(ms, 2),
+            "share": round(ms / total_ms, 3) if total_ms else 0,
+        }
+        for name, ms in sorted(totals.items(), key=lambda item: item[1], reverse=True)
+    ]
     
-    session.commit()
-
+    return {
+        "submission_id": submission.submission_id,
+        "started_at": datetime.fromtimestamp(trace["origin"], tz=timezone.utc),
+        "total_ms": round(total_ms, 2),
+        "breakdown": breakdown,
+        "spans": spans
+    }
@@ -1,30 +1,51 @@
-from fastapi import APIRouter, Depends
-from sqlmodel import Session
-from app.core.database import get_session
+from fastapi import APIRouter, Header, Query, Response
+from typing import Optional
 from app.core.leaderboard import leaderboard_service
 
 router = APIRouter()
 
-# get current leaderboard (HTTP endpoint)
+# get current leaderboard (HTTP endpoint), served from the in-memory index;
+# limit/offset select a page of ranks, X-Total-Count tells how many there are.
+# The ETag changes only with the page's contents, so polling clients sending
+# If-None-Match get an empty 304 until a score on their page changes
 @router.get("/")
-def get_leaderboard(session: Session = Depends(get_session)):
-    return leaderboard_service.get_leaderboard(session)
+def get_leaderboard(
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    if_none_match: Optional[str] = Header(None)
+):
+    page = leaderboard_service.get_leaderboard_page(limit, offset)
+    if if_none_match and etag_matches(if_none_match, page.etag):
+        return Response(status_code=304, headers={"ETag": page.etag, "Cache-Control": "no-cache"})
+    
+    return Response(
+        content=page.body,
+        media_type="application/json",
+        headers={"ETag": page.etag, "Cache-Control": "no-cache", "X-Total-Count": str(page.total)}
+    )
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # weak comparison, as If-None-Match asks for
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
 
 # get specific user's rank and details
 @router.get("/user/{user_id}")
-def get_user_rank(
-    user_id: int,
-    session: Session = Depends(get_session)
-):
-    leaderboard = leaderboard_service.get_leaderboard(session)
-    
-    user_rank = None
-    for entry in leaderboard:
-        if entry["user_id"] == user_id:
-            user_rank = entry
-            break
+def get_user_rank(user_id: int):
+    user_rank = leaderboard_service.get_user_rank(user_id)
     
     if not user_rank:
         return {"error": "User not found in leaderboard"}
     
-    return user_rank
\ No newline at end of file
+    return user_rank
+
+# get the rows around a user's position ("neighbors around me")
+@router.get("/user/{user_id}/neighbors")
+def get_user_neighbors(user_id: int, radius: int = Query(5, ge=0, le=100)):
+    neighbors = leaderboard_service.get_neighbors(user_id, radius)
+    
+    if neighbors is None:
+        return {"error": "User not found in leaderboard"}
+    
+    return neighbors
@@ -0,0 +1,42 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+from sqlmodel import Session
+from app.core.database import get_session
+from app.core.config import settings
+from app.core import judge_queue
+from app.core.metrics import registry, JUDGE_QUEUE_DEPTH, BOX_POOL_SIZE
+from typing import Dict, Optional
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+def write_snapshot() -> Optional[Dict]:
+    """Hand this API process's metrics to whichever process is scraped next;
+    the snapshot written, or None if it could not be"""
+    try:
+        return registry.write_snapshot(settings.METRICS_DIR, "api")
+    except OSError as e:
+        logger.warning(f"Could not write metrics snapshot: {e}")
+        return None
+
+async def flush_snapshots(interval: float):
+    while True:
+        await asyncio.to_thread(write_snapshot)
+        await asyncio.sleep(interval)
+
+# Prometheus scrape target; metrics of the other API processes and of the judge
+# workers are merged in from METRICS_DIR
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics(session: Session = Depends(get_session)):
+    JUDGE_QUEUE_DEPTH.set(judge_queue.queue_depth(session))
+    BOX_POOL_SIZE.set(settings.ISOLATE_BOX_COUNT)
+    # report exactly what this process's snapshot now holds, so the totals do
+    # not go backwards when the next scrape lands on another process
+    own = write_snapshot()
+    return PlainTextResponse(
+        registry.render(settings.METRICS_DIR, own),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -2,7 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
 from sqlmodel import Session, select
 from app.core.database import get_session
 from app.core.security import get_current_user
-from app.models import Submission, User, SubmissionStatus, Problem
+from app.models import Submission, User, SubmissionStatus, Problem, SubmissionTestResult
 from datetime import datetime
 from pydantic import BaseModel
 
@@ -41,6 +41,28 @@ def get_submission(
     
     return submission
 
+@router.get("/{submission_id}/tests")
+def get_submission_test_results(
+    submission_id: int, 
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
+):
+    """Per-test-case verdict, CPU time, wall time and peak memory of a submission"""
+    
+    submission = session.get(Submission, submission_id)
+    if not submission:
+        raise HTTPException(status_code=404, detail="Submission not found")
+    
+    if submission.user_id != current_user.user_id:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    results = session.exec(
+        select(SubmissionTestResult)
+        .where(SubmissionTestResult.submission_id == submission_id)
+        .order_by(SubmissionTestResult.test_index)
+    ).all()
+    return results
+
 
 @router.post("/")
 def create_submission(
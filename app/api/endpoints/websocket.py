@@ -1,26 +1,22 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends
-from sqlmodel import Session
-from app.core.database import get_session
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 from app.core.leaderboard import leaderboard_service
 
 router = APIRouter()
 
 #note: show to Pablo
 @router.websocket("/ws/leaderboard")
-async def websocket_leaderboard(websocket: WebSocket, session: Session = Depends(get_session)):
+async def websocket_leaderboard(websocket: WebSocket):
+    # accepts and queues a versioned snapshot; diffs follow
     await leaderboard_service.connect(websocket)
     try:
-        # send initial leaderboard when client connects
-        leaderboard = leaderboard_service.get_leaderboard(session)
-        await websocket.send_json(leaderboard)
-        
         # keep connection alive - wait for client messages
         while True:
             data = await websocket.receive_text()
-            # client can send "refresh" to get latest leaderboard
-            if data == "refresh":
-                leaderboard = leaderboard_service.get_leaderboard(session)
-                await websocket.send_json(leaderboard)
+            # client can send "refresh" (or "resync" after a version gap) to get a new snapshot
+            if data in ("refresh", "resync"):
+                leaderboard_service.send_snapshot(websocket)
                 
     except WebSocketDisconnect:
-        leaderboard_service.disconnect(websocket)
\ No newline at end of file
+        pass
+    finally:
+        leaderboard_service.disconnect(websocket)
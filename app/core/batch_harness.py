@@ -0,0 +1,154 @@
+"""
+Batch harness: runs all test cases of a submission from one sandboxed interpreter.
+
+This file is copied into the sandbox and run there (not imported by the app):
+
+    python3 batch_harness.py <per-case CPU time limit in seconds>
+
+It reads the case names from cases/index and, for every case, forks a child
+that runs the problem's run.py with cases/<name> as stdin and out/<name> as
+stdout. One JSON line per case is appended to report.jsonl. Interpreter
+startup is paid once per submission instead of once per case.
+
+The submission only ever runs in the children, so it cannot touch how it is
+timed: this process measures each child with wait4 and kills it at the
+per-case limit, while isolate still caps the whole batch. Every case starts
+from a fresh fork, so module-level state in solution does not carry over.
+Needs room for two processes in the sandbox (this one and one child).
+"""
+import json
+import math
+import os
+import resource
+import signal
+import sys
+import time
+import traceback
+
+# how often a running case's CPU time is checked
+POLL_INTERVAL = 0.002
+
+# exit codes of a case's child
+EXIT_OK = 0
+EXIT_RE = 1
+EXIT_MLE = 3
+
+def cpu_time(pid):
+    """CPU seconds used so far by a running child"""
+    try:
+        with open("/proc/%d/stat" % pid, "rb") as f:
+            fields = f.read().rsplit(b")", 1)[1].split()
+    except (OSError, IndexError):
+        return 0.0
+    # utime and stime are fields 14 and 15, counted from the pid
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+def run_case(harness, name, limit):
+    """Runs in the forked child; never returns"""
+    code = EXIT_RE
+    try:
+        # backstop only: the parent kills the child at the exact limit
+        cpu = math.ceil(limit) + 1
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu))
+        for fd, path, flags in (
+            (0, "cases/" + name, os.O_RDONLY),
+            (1, "out/" + name, os.O_WRONLY | os.O_CREAT | os.O_TRUNC),
+            (2, "err/" + name, os.O_WRONLY | os.O_CREAT | os.O_TRUNC),
+        ):
+            opened = os.open(path, flags, 0o644)
+            os.dup2(opened, fd)
+            os.close(opened)
+
+        try:
+            exec(harness, {"__name__": "__main__"})
+            code = EXIT_OK
+        except MemoryError:
+            code = EXIT_MLE
+        except SystemExit as e:
+            if e.code in (None, 0):
+                code = EXIT_OK
+            else:
+                sys.stderr.write("SystemExit: %s\n" % (e.code,))
+        except BaseException:
+            traceback.print_exc()
+        sys.stdout.flush()
+        sys.stderr.flush()
+    finally:
+        os._exit(code)
+
+def wait_case(pid, limit):
+    """Wait for a case's child, killing it at the CPU limit (or at a wall
+    limit derived from it, so a sleeping program cannot hang the batch);
+    (status, cpu time, wall time, max rss)"""
+    wall_limit = limit * 2 + 1
+    start = time.perf_counter()
+    killed = False
+    while True:
+        waited, status, usage = os.wait4(pid, os.WNOHANG)
+        if waited:
+            break
+        if cpu_time(pid) > limit or time.perf_counter() - start > wall_limit:
+            os.kill(pid, signal.SIGKILL)
+            killed = True
+            waited, status, usage = os.wait4(pid, 0)
+            break
+        time.sleep(POLL_INTERVAL)
+    wall = time.perf_counter() - start
+    cpu = usage.ru_utime + usage.ru_stime
+
+    if killed or cpu > limit:
+        verdict = "TO"
+    elif os.WIFSIGNALED(status):
+        # SIGKILL here is the RLIMIT_CPU backstop
+        verdict = "TO" if os.WTERMSIG(status) in (signal.SIGXCPU, signal.SIGKILL) else "RE"
+    elif os.WEXITSTATUS(status) == EXIT_OK:
+        verdict = "OK"
+    elif os.WEXITSTATUS(status) == EXIT_MLE:
+        verdict = "MLE"
+    else:
+        verdict = "RE"
+    return verdict, cpu, wall, usage.ru_maxrss
+
+def main():
+    limit = float(sys.argv[1])
+
+    with open("cases/index") as f:
+        names = [line for line in f.read().split("\n") if line]
+    with open("run.py") as f:
+        harness = compile(f.read(), "run.py", "exec")
+
+    with open("report.jsonl", "w") as report:
+        for name in names:
+            # nothing buffered may be duplicated into the child
+            sys.stdout.flush()
+            sys.stderr.flush()
+            report.flush()
+            pid = os.fork()
+            if pid == 0:
+                report.close()
+                run_case(harness, name, limit)
+
+            status, cpu, wall, max_rss = wait_case(pid, limit)
+            tb = None
+            if status == "RE":
+                try:
+                    with open("err/" + name, errors="replace") as f:
+                        tb = f.read()
+                except OSError:
+                    tb = ""
+
+            report.write(json.dumps({
+                "name": name,
+                "status": status,
+                "time": cpu,
+                "wall_time": wall,
+                "max_rss": max_rss,
+                "traceback": tb,
+            }) + "\n")
+            report.flush()
+
+            if status != "OK":
+                break
+
+if __name__ == "__main__":
+    main()
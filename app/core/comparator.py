@@ -0,0 +1,173 @@
+from dataclasses import dataclass
+from os.path import commonprefix
+from typing import BinaryIO, Optional, Tuple
+import math
+import re
+
+# Output is compared in fixed-size chunks so memory use does not depend on how
+# much a submission prints, and comparison stops at the first difference.
+CHUNK_SIZE = 64 * 1024
+
+_NON_SPACE = re.compile(rb"\S")
+_SPACE = re.compile(rb"\s")
+
+@dataclass
+class CompareResult:
+    ok: bool
+    # first differing line of the program's output (1-based)
+    line: Optional[int] = None
+    message: str = ""
+
+class _Reader:
+    """Chunked reader over a binary stream that tracks the current line"""
+
+    def __init__(self, stream: BinaryIO):
+        self.stream = stream
+        self.buf = b""
+        self.pos = 0
+        self.line = 1
+
+    def fill(self) -> bool:
+        """Make sure unread bytes are buffered; False at end of stream"""
+        if self.pos < len(self.buf):
+            return True
+        self.buf = self.stream.read(CHUNK_SIZE)
+        self.pos = 0
+        return bool(self.buf)
+
+    def advance(self, n: int):
+        self.line += self.buf.count(b"\n", self.pos, self.pos + n)
+        self.pos += n
+
+    def skip_space(self) -> bool:
+        """Skip whitespace; False if the stream ended first"""
+        while self.fill():
+            match = _NON_SPACE.search(self.buf, self.pos)
+            if match:
+                self.advance(match.start() - self.pos)
+                return True
+            self.advance(len(self.buf) - self.pos)
+        return False
+
+    def next_token(self, limit: Optional[int] = None) -> Optional[Tuple[bytes, int]]:
+        """Next whitespace-delimited token and its line, or None at the end.
+
+        With a `limit`, at most limit + 1 bytes of the token are kept and the
+        rest is skipped, so a giant token costs bounded memory.
+        """
+        if not self.skip_space():
+            return None
+        line = self.line
+        token = b""
+        while self.fill():
+            match = _SPACE.search(self.buf, self.pos)
+            end = match.start() if match else len(self.buf)
+            if limit is None:
+                token += self.buf[self.pos:end]
+            elif len(token) <= limit:
+                token += self.buf[self.pos:min(end, self.pos + limit + 1 - len(token))]
+            self.pos = end
+            if match:
+                break
+        return token, line
+
+class Comparator:
+    """Compares expected output with a program's output, both as binary streams"""
+
+    def compare(self, expected: BinaryIO, output: BinaryIO) -> CompareResult:
+        raise NotImplementedError
+
+class ExactComparator(Comparator):
+    """Byte-for-byte equality, ignoring leading and trailing whitespace"""
+
+    def compare(self, expected: BinaryIO, output: BinaryIO) -> CompareResult:
+        exp, out = _Reader(expected), _Reader(output)
+        exp.skip_space()
+        out.skip_space()
+
+        while exp.fill() and out.fill():
+            n = min(len(exp.buf) - exp.pos, len(out.buf) - out.pos)
+            a = exp.buf[exp.pos:exp.pos + n]
+            b = out.buf[out.pos:out.pos + n]
+            if a != b:
+                same = len(commonprefix([a, b]))
+                exp.advance(same)
+                out.advance(same)
+                break
+            exp.advance(n)
+            out.advance(n)
+
+        # whatever is left on either side may only be trailing whitespace
+        line = out.line
+        exp_done = not exp.skip_space()
+        out_done = not out.skip_space()
+        if exp_done and out_done:
+            return CompareResult(True)
+        if exp_done:
+            return CompareResult(False, line, f"unexpected extra output on line {line}")
+        if out_done:
+            return CompareResult(False, line, f"output ended early on line {line}")
+        return CompareResult(False, line, f"first difference on line {line}")
+
+class TokenComparator(Comparator):
+    """Whitespace-insensitive comparison of whitespace-separated tokens"""
+
+    def tokens_match(self, expected: bytes, output: bytes) -> bool:
+        return expected == output
+
+    def output_limit(self, expected: bytes) -> int:
+        # one extra byte is enough to tell a longer token apart
+        return len(expected) + 1
+
+    def compare(self, expected: BinaryIO, output: BinaryIO) -> CompareResult:
+        exp, out = _Reader(expected), _Reader(output)
+        while True:
+            exp_token = exp.next_token()
+            if exp_token is None:
+                if out.skip_space():
+                    return CompareResult(False, out.line, f"unexpected extra output on line {out.line}")
+                return CompareResult(True)
+
+            out_token = out.next_token(limit=self.output_limit(exp_token[0]))
+            if out_token is None:
+                return CompareResult(False, out.line, f"output ended early on line {out.line}")
+
+            if not self.tokens_match(exp_token[0], out_token[0]):
+                line = out_token[1]
+                return CompareResult(False, line, f"first difference on line {line}")
+
+class FloatComparator(TokenComparator):
+    """Token comparison where numeric tokens may differ within a tolerance"""
+
+    def __init__(self, abs_tol: float = 1e-6, rel_tol: float = 1e-6):
+        self.abs_tol = abs_tol
+        self.rel_tol = rel_tol
+
+    def output_limit(self, expected: bytes) -> int:
+        # numbers may be printed with more digits than the expected output
+        return max(len(expected) + 1, 512)
+
+    def tokens_match(self, expected: bytes, output: bytes) -> bool:
+        if expected == output:
+            return True
+        try:
+            a, b = float(expected), float(output)
+        except ValueError:
+            return False
+        if math.isnan(a) or math.isnan(b):
+            return math.isnan(a) and math.isnan(b)
+        return math.isclose(a, b, rel_tol=self.rel_tol, abs_tol=self.abs_tol)
+
+def get_comparator(config: dict) -> Comparator:
+    """Build the comparator described by a problem's [compare] table"""
+    mode = config.get("mode", "exact")
+    if mode == "exact":
+        return ExactComparator()
+    if mode == "tokens":
+        return TokenComparator()
+    if mode == "float":
+        return FloatComparator(
+            abs_tol=float(config.get("abs_tol", 1e-6)),
+            rel_tol=float(config.get("rel_tol", 1e-6)),
+        )
+    raise ValueError(f"Unknown compare mode: {mode}")
@@ -1,6 +1,8 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from typing import ClassVar
 from pathlib import Path
+import os
+import tempfile
 
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(
@@ -25,5 +27,70 @@ class Settings(BaseSettings):
         """Get the path to a specific problem directory"""
         return self.PROBLEMS_DIR / f"problem{problem_id}"
 
+    # --- Judge Settings ---
+    # "isolate", or "local" to run without isolate (rlimits only, not secure)
+    SANDBOX_BACKEND: str = "isolate"
+    # where the local backend creates its boxes
+    LOCAL_SANDBOX_ROOT: Path = Path(tempfile.gettempdir()) / "acn-judge-sandbox"
+    # interpreter used inside the sandbox
+    JUDGE_PYTHON: str = "/usr/bin/python3"
+    # isolate boxes are leased from [ISOLATE_FIRST_BOX_ID, ISOLATE_FIRST_BOX_ID + ISOLATE_BOX_COUNT)
+    ISOLATE_ROOT: Path = Path("/var/local/lib/isolate")
+    ISOLATE_FIRST_BOX_ID: int = 0
+    ISOLATE_BOX_COUNT: int = os.cpu_count() or 1
+    # lock files used to share the box range between judge processes
+    BOX_LOCK_DIR: Path = Path(tempfile.gettempdir()) / "acn-judge-boxes"
+    # how many boxes a single submission may spread its test cases over
+    JUDGE_PARALLEL_TESTS: int = 1
+    # per-run scratch space (meta files, kept artifacts); tmpfs when available
+    JUDGE_SCRATCH_DIR: Path = Path("/dev/shm") if Path("/dev/shm").is_dir() else Path(tempfile.gettempdir())
+    # debug mode: keep each run's outputs, stderr and meta files instead of deleting them
+    JUDGE_KEEP_ARTIFACTS: bool = False
+    # extra CPU seconds a batch-harness run gets for interpreter startup
+    JUDGE_BATCH_STARTUP_TIME: float = 1.0
+
+    # --- Pre-compilation Settings ---
+    COMPILE_WORKERS: int = 2
+    COMPILE_TIMEOUT: float = 5.0                     # seconds
+    COMPILE_MEMORY_LIMIT: int = 256 * 1024 * 1024    # bytes of address space per compile worker
+
+    # --- Problem Cache Settings ---
+    PROBLEM_CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+    PROBLEM_CACHE_CHECK_INTERVAL: float = 2.0       # seconds between mtime checks of a cached problem
+    PROBLEM_CACHE_MAX_INLINE: int = 1024 * 1024     # larger test inputs are staged from disk
+
+    # --- Verdict Cache Settings ---
+    # identical resubmissions for an unchanged problem reuse the stored verdict
+    VERDICT_CACHE_ENABLED: bool = True
+    VERDICT_CACHE_SIZE: int = 10000
+
+    # --- Judge Queue Settings ---
+    JUDGE_WORKER_PROCESSES: int = 1
+    JUDGE_CONCURRENCY: int = 4        # submissions judged at once by one worker process
+    JUDGE_POLL_INTERVAL: float = 0.5  # seconds between claims when the queue is empty
+    JUDGE_LEASE_SECONDS: int = 300    # a claimed submission is re-queued if not finished by then
+    JUDGE_MAX_ATTEMPTS: int = 3
+    JUDGE_RETRY_BACKOFF: int = 5      # seconds before a failed attempt is retried
+
+    # --- Metrics Settings ---
+    # judge workers and API processes write metric snapshots here for /metrics
+    METRICS_DIR: Path = Path(tempfile.gettempdir()) / "acn-judge-metrics"
+    METRICS_FLUSH_INTERVAL: float = 5.0  # seconds between snapshots of a process
+
+    # --- Leaderboard Settings ---
+    LEADERBOARD_POLL_INTERVAL: float = 1.0  # how often API processes look for changes the pub/sub missed
+    LEADERBOARD_SYNC_LAG: float = 30.0      # seconds of totals re-read on every poll, for late commits
+    LEADERBOARD_BROADCAST_INTERVAL: float = 0.25  # at most one broadcast per this many seconds
+    LEADERBOARD_CLIENT_QUEUE: int = 32       # updates a websocket client may fall behind before it is dropped
+    LEADERBOARD_SEND_TIMEOUT: float = 5.0    # seconds a single send to a client may take
+    # how score changes reach every API process: "postgres" (LISTEN/NOTIFY),
+    # "unix" (sockets in LEADERBOARD_PUBSUB_DIR, one host) or "memory" (this process only; worker results then arrive by polling)
+    LEADERBOARD_PUBSUB: str = "postgres"
+    LEADERBOARD_PUBSUB_DIR: Path = Path(tempfile.gettempdir()) / "acn-leaderboard-pubsub"
+
+    def get_box_path(self, box_id: int) -> Path:
+        """Get the path to the working directory of an isolate box"""
+        return self.ISOLATE_ROOT / str(box_id) / "box"
+
 # instance of the class to be used throughout the app
 settings = Settings()
\ No newline at end of file
@@ -0,0 +1,91 @@
+from fastapi import WebSocket, WebSocketDisconnect
+from app.core.metrics import LEADERBOARD_CLIENTS, LEADERBOARD_CLIENTS_DROPPED
+from typing import Dict, Optional
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# "Try Again Later": the client may reconnect and start from a new snapshot
+CLOSE_TOO_SLOW = 1013
+
+class _Subscriber:
+    def __init__(self, websocket: WebSocket, max_queue: int):
+        self.websocket = websocket
+        self.queue: "asyncio.Queue[str]" = asyncio.Queue(max_queue)
+        self.task: Optional[asyncio.Task] = None
+
+class Fanout:
+    """Delivers messages to many websockets without waiting on any one of them.
+
+    Messages are serialized once by the caller and queued per client; each
+    client has its own sender task, so a slow client only delays itself. A
+    client whose queue fills up or whose send does not finish within
+    `send_timeout` seconds is disconnected.
+    """
+
+    def __init__(self, max_queue: int, send_timeout: float):
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self._subscribers: Dict[WebSocket, _Subscriber] = {}
+
+    def __len__(self) -> int:
+        return len(self._subscribers)
+
+    def add(self, websocket: WebSocket):
+        subscriber = _Subscriber(websocket, self.max_queue)
+        subscriber.task = asyncio.create_task(self._sender(subscriber))
+        self._subscribers[websocket] = subscriber
+        LEADERBOARD_CLIENTS.set(len(self._subscribers))
+
+    def remove(self, websocket: WebSocket):
+        subscriber = self._subscribers.pop(websocket, None)
+        if subscriber is None:
+            return
+        if subscriber.task is not asyncio.current_task():
+            subscriber.task.cancel()
+        LEADERBOARD_CLIENTS.set(len(self._subscribers))
+
+    def send(self, websocket: WebSocket, text: str):
+        """Queue a message for one client"""
+        subscriber = self._subscribers.get(websocket)
+        if subscriber is not None:
+            self._enqueue(subscriber, text)
+
+    def publish(self, text: str):
+        """Queue a message for every client"""
+        for subscriber in list(self._subscribers.values()):
+            self._enqueue(subscriber, text)
+
+    def _enqueue(self, subscriber: _Subscriber, text: str):
+        try:
+            subscriber.queue.put_nowait(text)
+        except asyncio.QueueFull:
+            self._drop(subscriber, "queue_full")
+
+    def _drop(self, subscriber: _Subscriber, reason: str):
+        if subscriber.websocket not in self._subscribers:
+            return
+        logger.info(f"Dropping leaderboard client ({reason})")
+        LEADERBOARD_CLIENTS_DROPPED.inc(reason=reason)
+        self.remove(subscriber.websocket)
+        # the receive loop of the endpoint ends once the socket is closed
+        asyncio.create_task(self._close(subscriber.websocket))
+
+    async def _close(self, websocket: WebSocket):
+        try:
+            await asyncio.wait_for(websocket.close(code=CLOSE_TOO_SLOW), self.send_timeout)
+        except (WebSocketDisconnect, RuntimeError, OSError, asyncio.TimeoutError):
+            pass
+
+    async def _sender(self, subscriber: _Subscriber):
+        while True:
+            text = await subscriber.queue.get()
+            try:
+                await asyncio.wait_for(subscriber.websocket.send_text(text), self.send_timeout)
+            except asyncio.TimeoutError:
+                self._drop(subscriber, "send_timeout")
+                return
+            except (WebSocketDisconnect, RuntimeError, OSError):
+                self._drop(subscriber, "disconnected")
+                return
@@ -0,0 +1,665 @@
+from sqlmodel import Session, select
+from app.core.config import settings
+from app.core.sandbox import box_pool, BoxPoolTimeout, Sandbox, sandbox_backend, scratch_dir
+from app.core.problem_cache import problem_cache, ProblemAssets, TestCase
+from app.core.comparator import Comparator, CompareResult
+from app.core.verdict_cache import verdict_cache, code_hash, CachedVerdict
+from app.core.precompile import precompile, CompileResult
+from app.core.metrics import JUDGE_STAGE_SECONDS, JUDGE_VERDICTS
+from app.core import judge_queue
+from app.core.leaderboard_pubsub import leaderboard_pubsub
+from app.models import SubmissionStatus, SubmissionTestResult, Problem, UserScore, UserTotal
+from sqlalchemy import update
+from sqlalchemy.dialects.postgresql import insert
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import List, Dict, Optional, Tuple
+import asyncio
+import io
+import json
+import shutil
+import threading
+import time
+
+# Constants from judge.py
+MEMORY_LIMIT = "64000"  # 64 MB
+TIME_LIMIT = "0.1"  # 0.1s
+
+# Harness copied into the box for problems with [harness] mode = "batch"
+BATCH_HARNESS_FILE = "batch_harness.py"
+BATCH_HARNESS = (Path(__file__).parent / BATCH_HARNESS_FILE).read_bytes()
+
+def classify_traceback(path: Path):
+    """Classifies a Python traceback and sanitizes it"""
+    try:
+        with open(path, 'r') as f:
+            tb = f.read()
+    except FileNotFoundError:
+        return {"status": "RE", "traceback": "Error file not found"}
+
+    return classify_traceback_text(tb)
+
+def classify_traceback_text(tb: str):
+    """Classifies a Python traceback given as text and sanitizes it"""
+    tb_lower = tb.lower()
+    
+    memory_signatures = [
+        "memoryerror",
+        "cannot allocate memory",
+        "out of memory",
+        "oom",
+    ]
+
+    # Only consider it MLE if we have explicit memory error keywords
+    # Don't rely solely on "killed" as that could be from time limit
+    if any(sig in tb_lower for sig in memory_signatures):
+        return {"status": "MLE"}
+
+    lines = tb.strip().splitlines()
+    filtered = []
+
+    for line in lines:
+        if "solution.py" in line:
+            filtered.append(line)
+
+    error_line = lines[-1] if lines else ""
+    if error_line and error_line not in filtered:
+        filtered.append(error_line)
+
+    sanitized = "\n".join(filtered).strip()
+    
+    return {
+        "status": "RE",
+        "traceback": sanitized
+    }
+
+class StageTimings:
+    """Accumulates the wall-clock time a judge run spends in each stage.
+
+    Every stage is also kept as a span of the submission's trace: name, start
+    and duration in ms relative to `origin` (epoch seconds, by default when
+    the timings were created), plus an optional detail such as the test case.
+    """
+    
+    def __init__(self, origin: Optional[float] = None):
+        self.origin = time.time() if origin is None else origin
+        self.totals: Dict[str, float] = {}
+        self.spans: List[list] = []
+        self._lock = threading.Lock()
+    
+    def add_span(self, name: str, start: float, duration: float, detail: Optional[str] = None):
+        """Record a span that was timed elsewhere (start in epoch seconds)"""
+        span = [name, round((start - self.origin) * 1000, 2), round(duration * 1000, 2)]
+        if detail is not None:
+            span.append(detail)
+        with self._lock:
+            self.spans.append(span)
+    
+    @contextmanager
+    def stage(self, name: str, detail: Optional[str] = None):
+        start_time = time.time()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            JUDGE_STAGE_SECONDS.observe(elapsed, stage=name)
+            with self._lock:
+                self.totals[name] = self.totals.get(name, 0.0) + elapsed
+            self.add_span(name, start_time, elapsed, detail)
+    
+    def summary(self) -> str:
+        return ", ".join(f"{name}={seconds * 1000:.1f}ms" for name, seconds in self.totals.items())
+    
+    def compact(self) -> str:
+        """The trace as compact JSON, as stored in Submission.trace"""
+        with self._lock:
+            return json.dumps({"origin": self.origin, "spans": self.spans}, separators=(",", ":"))
+
+def _read_meta(path: Path) -> dict:
+    """Parse an isolate meta file (key:value per line)"""
+    meta = {}
+    try:
+        with open(path, 'r', encoding='utf-8') as meta_file:
+            for line in meta_file.read().split('\n'):
+                if line.strip() and ':' in line:
+                    key, value = line.split(':', 1)
+                    meta[key] = value
+    except FileNotFoundError:
+        meta = {'status': 'XX'}
+    return meta
+
+async def _init_box(sandbox: Sandbox, assets: ProblemAssets, code: str, bytecode: Optional[bytes]):
+    """Set up a box once per submission: fresh sandbox plus solution and harness"""
+    PROBLEM_FILE = 'run.py'
+    
+    # Fresh sandbox (any leftovers of a previous run are removed first)
+    await sandbox.init()
+    
+    # Write solution straight into the sandbox; precompiled bytecode is
+    # imported as a sourceless module so it is not compiled again per test
+    if bytecode is not None:
+        sandbox.stage("solution.pyc", bytecode)
+    else:
+        sandbox.stage("solution.py", code)
+    
+    # Write problem file into the sandbox
+    if assets.harness is not None:
+        sandbox.stage(PROBLEM_FILE, assets.harness)
+
+def _stage_case(sandbox: Sandbox, test_case: TestCase):
+    # Stage test case input into the sandbox (large inputs come from disk)
+    if test_case.input is not None:
+        sandbox.stage("stdin.txt", test_case.input)
+    else:
+        sandbox.stage_file("stdin.txt", test_case.path)
+    
+    # Reset output and error files left by the previous case
+    sandbox.stage("stdout.txt")
+    sandbox.stage("stderr.txt")
+
+def _compare_output(comparator: Comparator, expected: bytes, path: Path) -> CompareResult:
+    # Stream the output straight from the sandbox
+    with open(path, 'rb') as output_file:
+        return comparator.compare(io.BytesIO(expected), output_file)
+
+async def _run_test_case(sandbox: Sandbox, test_case: TestCase, comparator: Comparator, scratch: Path,
+                         timings: StageTimings) -> dict:
+    """Run a single test case in a box prepared by _init_box.
+
+    Only stdin/stdout/stderr are reset between cases; the cases of one
+    submission share the box, so they only ever see that submission's files.
+    Staging and comparing touch files of any size, so they run off the event
+    loop.
+    """
+    META_FILE = scratch / "meta" / test_case.name
+    PROBLEM_FILE = 'run.py'
+    
+    return_dict = {}
+    
+    with timings.stage("stage", test_case.name):
+        await asyncio.to_thread(_stage_case, sandbox, test_case)
+    
+    # Run python file with constraints
+    with timings.stage("run", test_case.name):
+        clean_exit = await sandbox.run(
+            [settings.JUDGE_PYTHON, PROBLEM_FILE],
+            meta=META_FILE,
+            time_limit=float(TIME_LIMIT),
+            mem_limit=int(MEMORY_LIMIT),
+            stdin="stdin.txt",
+            stdout="stdout.txt",
+            stderr="stderr.txt",
+        )
+    
+    # Collect results and compare with the expected output
+    with timings.stage("compare", test_case.name):
+        # Parse execution metadata
+        meta = _read_meta(META_FILE)
+    
+        return_dict["name"] = test_case.name
+        return_dict["mem"] = round(float(meta.get("max-rss", 0))/1000, 2)
+        return_dict["time"] = round(float(meta.get("time", 0)), 3)
+        return_dict["wall_time"] = round(float(meta.get("time-wall", 0)), 3)
+        return_dict["max_rss"] = int(meta.get("max-rss", 0))
+        
+        # Debug mode: keep what the program printed next to its meta file
+        if settings.JUDGE_KEEP_ARTIFACTS:
+            shutil.copyfile(sandbox.collect("stdout.txt"), scratch / "output" / test_case.name)
+            shutil.copyfile(sandbox.collect("stderr.txt"), scratch / "error" / test_case.name)
+    
+        # Process execution result
+        if clean_exit:
+            if test_case.expected is None:
+                return_dict["status"] = "XX"
+            else:
+                result = await asyncio.to_thread(
+                    _compare_output, comparator, test_case.expected, sandbox.collect("stdout.txt")
+                )
+                if result.ok:
+                    return_dict["status"] = "AC"
+                else:
+                    return_dict["status"] = "WA"
+                    return_dict["line"] = result.line
+                    return_dict["message"] = result.message
+        else:
+            # Non-zero return code - check meta status first
+            meta_status = meta.get('status', '')
+        
+            # Handle time limit exceeded
+            if meta_status == "TO":
+                return_dict["status"] = "TO"
+            # Handle internal/sandbox errors
+            elif meta_status == "XX":
+                return_dict["status"] = "XX"
+            # Handle runtime errors and memory limit errors
+            else:
+                # Check stderr for error details
+                error_result = classify_traceback(sandbox.collect("stderr.txt"))
+                return_dict.update(error_result)
+    
+    return return_dict
+
+async def _cleanup_box(sandbox: Sandbox, timings: StageTimings):
+    # Final sandbox cleanup; the box goes back to the pool even if that fails
+    # or is cancelled, or its lock would stay held for the life of the process
+    try:
+        with timings.stage("cleanup", f"box {sandbox.box_id}"):
+            await sandbox.cleanup()
+    finally:
+        box_pool.release(sandbox.box_id)
+
+def _stage_batch(sandbox: Sandbox, cases: List[TestCase]):
+    sandbox.stage_dir("cases")
+    sandbox.stage_dir("out")
+    sandbox.stage_dir("err")
+    for test_case in cases:
+        if test_case.input is not None:
+            sandbox.stage(f"cases/{test_case.name}", test_case.input)
+        else:
+            sandbox.stage_file(f"cases/{test_case.name}", test_case.path)
+    sandbox.stage("cases/index", "\n".join(tc.name for tc in cases))
+    sandbox.stage(BATCH_HARNESS_FILE, BATCH_HARNESS)
+    sandbox.stage("stdout.txt")
+    sandbox.stage("stderr.txt")
+
+async def _run_batch(sandbox: Sandbox, assets: ProblemAssets, scratch: Path, timings: StageTimings) -> List[dict]:
+    """Run every test case from one interpreter with the batch harness.
+
+    Verdicts are produced in test order and stop at the first non-AC case,
+    like the per-case pipeline. If the sandbox kills the whole batch, the
+    first case without a report gets the sandbox's verdict.
+    """
+    META_FILE = scratch / "meta" / "batch"
+    cases = assets.test_cases
+    
+    with timings.stage("stage", "batch"):
+        await asyncio.to_thread(_stage_batch, sandbox, cases)
+    
+    # The whole batch may use every case's limit plus one interpreter startup
+    batch_time = float(TIME_LIMIT) * len(cases) + settings.JUDGE_BATCH_STARTUP_TIME
+    with timings.stage("run", "batch"):
+        await sandbox.run(
+            [settings.JUDGE_PYTHON, BATCH_HARNESS_FILE, TIME_LIMIT],
+            meta=META_FILE,
+            time_limit=batch_time,
+            wall_limit=batch_time * 2,
+            mem_limit=int(MEMORY_LIMIT),
+            # the harness and the child running the current case
+            processes=2,
+            stdout="stdout.txt",
+            stderr="stderr.txt",
+        )
+    
+    with timings.stage("compare", "batch"):
+        meta = _read_meta(META_FILE)
+        reports = {}
+        try:
+            with open(sandbox.collect("report.jsonl"), 'r', encoding='utf-8') as report_file:
+                for line in report_file:
+                    # a line cut short by a kill is simply treated as missing
+                    try:
+                        report = json.loads(line)
+                    except ValueError:
+                        continue
+                    reports[report["name"]] = report
+        except FileNotFoundError:
+            pass
+        
+        test_cases = []
+        for test_case in cases:
+            report = reports.get(test_case.name)
+            if report is None:
+                # The batch was killed while running this case
+                return_dict = {
+                    "name": test_case.name,
+                    "mem": round(float(meta.get("max-rss", 0))/1000, 2),
+                    "time": round(float(meta.get("time", 0)), 3),
+                    "wall_time": round(float(meta.get("time-wall", 0)), 3),
+                    "max_rss": int(meta.get("max-rss", 0)),
+                }
+                meta_status = meta.get('status', '')
+                if meta_status in ("TO", "XX"):
+                    return_dict["status"] = meta_status
+                else:
+                    return_dict.update(classify_traceback(sandbox.collect("stderr.txt")))
+                test_cases.append(return_dict)
+                break
+            
+            return_dict = {
+                "name": test_case.name,
+                "mem": round(report["max_rss"]/1000, 2),
+                "time": round(report["time"], 3),
+                "wall_time": round(report["wall_time"], 3),
+                "max_rss": int(report["max_rss"]),
+            }
+            if report["status"] == "OK":
+                if test_case.expected is None:
+                    return_dict["status"] = "XX"
+                else:
+                    result = await asyncio.to_thread(
+                        _compare_output, assets.comparator, test_case.expected,
+                        sandbox.collect(f"out/{test_case.name}")
+                    )
+                    if result.ok:
+                        return_dict["status"] = "AC"
+                    else:
+                        return_dict["status"] = "WA"
+                        return_dict["line"] = result.line
+                        return_dict["message"] = result.message
+            elif report["status"] == "RE":
+                return_dict.update(classify_traceback_text(report["traceback"] or ""))
+            else:
+                return_dict["status"] = report["status"]
+            
+            # Debug mode: keep what the program printed for this case
+            if settings.JUDGE_KEEP_ARTIFACTS:
+                shutil.copyfile(sandbox.collect(f"out/{test_case.name}"), scratch / "output" / test_case.name)
+            
+            test_cases.append(return_dict)
+            if return_dict["status"] != "AC":
+                break
+        
+        if settings.JUDGE_KEEP_ARTIFACTS:
+            shutil.copyfile(sandbox.collect("stderr.txt"), scratch / "error" / "batch")
+    
+    return test_cases
+
+async def _judge_tests(assets: ProblemAssets, code: str, bytecode: Optional[bytes], scratch: Path,
+                       parallel: int, timings: StageTimings) -> List[dict]:
+    """Run the test cases on up to `parallel` sandbox boxes at once.
+
+    Boxes pull test cases in order, and no case after the first non-AC verdict
+    is started, so the returned list is in test order and ends at the first
+    failure exactly as a sequential run would.
+    """
+    cases = assets.test_cases
+    backend = sandbox_backend()
+    
+    # Batch mode runs every case in a single interpreter, so a single box
+    if assets.batch and cases:
+        sandbox = backend(await box_pool.acquire_async())
+        try:
+            with timings.stage("init", f"box {sandbox.box_id}"):
+                await _init_box(sandbox, assets, code, bytecode)
+            return await _run_batch(sandbox, assets, scratch, timings)
+        finally:
+            await _cleanup_box(sandbox, timings)
+    
+    results: Dict[int, dict] = {}
+    next_index = 0
+    first_failure = len(cases)
+    
+    # All boxes run on one event loop, so the shared counters need no lock
+    async def work(sandbox: Sandbox):
+        nonlocal next_index, first_failure
+        with timings.stage("init", f"box {sandbox.box_id}"):
+            await _init_box(sandbox, assets, code, bytecode)
+        
+        while next_index < first_failure:
+            index = next_index
+            next_index += 1
+            
+            result = await _run_test_case(sandbox, cases[index], assets.comparator, scratch, timings)
+            
+            results[index] = result
+            if result["status"] != "AC":
+                first_failure = min(first_failure, index)
+    
+    # Always wait for one box; extra boxes are only used if free right now
+    boxes = [backend(await box_pool.acquire_async())]
+    try:
+        while len(boxes) < min(parallel, len(cases)):
+            try:
+                boxes.append(backend(box_pool.acquire(timeout=0)))
+            except BoxPoolTimeout:
+                break
+        
+        # every box finishes its current case before the boxes are cleaned up
+        outcomes = await asyncio.gather(*(work(sandbox) for sandbox in boxes), return_exceptions=True)
+        for outcome in outcomes:
+            if isinstance(outcome, BaseException):
+                raise outcome
+    finally:
+        for sandbox in boxes:
+            await _cleanup_box(sandbox, timings)
+    
+    test_cases = []
+    for index in sorted(results):
+        test_cases.append(results[index])
+        if results[index]["status"] != "AC":
+            break
+    return test_cases
+
+def _internal_error(session: Session, submission_id: int, worker_id: Optional[str], message: str):
+    submission = judge_queue.lock_leased(session, submission_id, worker_id)
+    if not submission:
+        return
+    submission.status = SubmissionStatus.INTERNAL_ERR
+    submission.result = message
+    session.commit()
+
+async def run_judge(submission_id: int, problem_path: str, code: str, session: Session,
+                    timings: Optional[StageTimings] = None, worker_id: Optional[str] = None):
+    """Run the judge on a submission.
+
+    Sandbox work is awaited, and blocking database calls run in a thread, so
+    one event loop can judge many submissions at once. Stages are recorded in
+    `timings` if given (e.g. already holding the queue wait of the submission).
+    With a `worker_id`, results are only written while that worker still
+    holds the submission's queue lease.
+    """
+    import logging
+    logger = logging.getLogger(__name__)
+    
+    if timings is None:
+        timings = StageTimings()
+    
+    # Ensure problem_path is absolute
+    problem_path = str(Path(problem_path).resolve())
+    
+    logger.info(f"Starting judge for submission {submission_id}")
+    logger.info(f"Problem path: {problem_path}")
+    
+    # Check that the configured sandbox can run here
+    try:
+        problem = sandbox_backend().check()
+    except ValueError as e:
+        problem = str(e)
+    if problem:
+        logger.error(f"Sandbox not usable: {problem}")
+        await asyncio.to_thread(_internal_error, session, submission_id, worker_id,
+                                f"Judge system not configured ({problem})")
+        return
+    
+    # Load test inputs, expected outputs and harness (cached across runs)
+    try:
+        assets = await asyncio.to_thread(problem_cache.get, problem_path)
+    except FileNotFoundError as e:
+        logger.error(str(e))
+        await asyncio.to_thread(_internal_error, session, submission_id, worker_id, "Test cases directory not found")
+        return
+    except ValueError as e:
+        logger.error(f"Invalid judge configuration in {problem_path}: {e}")
+        await asyncio.to_thread(_internal_error, session, submission_id, worker_id, f"Invalid problem configuration: {e}")
+        return
+    
+    # Fail fast on code that does not even compile
+    with timings.stage("compile"):
+        compiled = await precompile(code)
+    
+    test_cases = []
+    if compiled.ok:
+        with scratch_dir(f"submission-{submission_id}-") as scratch:
+            for name in ("meta", "output", "error"):
+                (scratch / name).mkdir()
+            test_cases = await _judge_tests(assets, code, compiled.bytecode, scratch,
+                                            settings.JUDGE_PARALLEL_TESTS, timings)
+    
+    with timings.stage("db_commit"):
+        await asyncio.to_thread(_store_verdict, session, submission_id, worker_id, code, assets, compiled,
+                                test_cases, timings)
+    logger.info(f"Submission {submission_id} ran {len(test_cases)} test cases; stage timings: {timings.summary()}")
+
+def _store_verdict(session: Session, submission_id: int, worker_id: Optional[str], code: str,
+                   assets: ProblemAssets, compiled: CompileResult, test_cases: List[dict], timings: StageTimings):
+    import logging
+    logger = logging.getLogger(__name__)
+    
+    all_accepted = all(tc["status"] == "AC" for tc in test_cases)
+  #~~~ UPDATED SECTION ~~~#
+  # Score calculation and leaderboard updates
+
+    # Get submission (locked, so a re-judge cannot slip in) and problem details
+    submission = judge_queue.lock_leased(session, submission_id, worker_id)
+    if not submission:
+        logger.warning(f"Submission {submission_id} is gone or no longer leased to this worker; dropping its verdict")
+        return
+    
+    # Get problem to determine max score
+    problem = session.get(Problem, submission.problem_id)
+    max_score = problem.max_score if problem else 100
+    
+    # Calculate score based on test results
+    score = calculate_scores(test_cases, max_score)
+    
+    # Update submission with score and status
+    submission.score = score  # Add the score field
+    submission.code_hash = code_hash(code)
+    submission.problem_version = assets.version
+    
+    if not compiled.ok:
+        submission.status = SubmissionStatus.COMPILE_ERR
+        submission.result = compiled.error
+    elif all_accepted and test_cases:
+        submission.status = SubmissionStatus.ACCEPTED
+        submission.result = f"All {len(test_cases)} test cases passed - Score: {score}/{max_score}"
+    elif test_cases:
+        # Set status based on first failure
+        first_failure = next((tc for tc in test_cases if tc["status"] != "AC"), None)
+        if first_failure:
+            status_map = {
+                "WA": SubmissionStatus.WRONG_ANS,
+                "TO": SubmissionStatus.TIME_LIMIT,
+                "MLE": SubmissionStatus.MEM_LIMIT,
+                "RE": SubmissionStatus.RUNTIME_ERR,
+                "XX": SubmissionStatus.INTERNAL_ERR
+            }
+            submission.status = status_map.get(first_failure["status"], SubmissionStatus.RUNTIME_ERR)
+            detail = f" ({first_failure['message']})" if first_failure.get("message") else ""
+            submission.result = first_failure.get("traceback", 
+                               f"Failed on test case with status {first_failure['status']}{detail} - Score: {score}/{max_score}")
+    else:
+        submission.status = SubmissionStatus.INTERNAL_ERR
+        submission.result = "No test cases found"
+    
+    # Per-test results are inserted in one batch with the submission update
+    session.add_all([
+        SubmissionTestResult(
+            submission_id=submission_id,
+            test_index=index,
+            test_name=tc["name"],
+            status=tc["status"],
+            cpu_time=tc["time"],
+            wall_time=tc["wall_time"],
+            max_rss=tc["max_rss"]
+        )
+        for index, tc in enumerate(test_cases)
+    ])
+    
+    # Commit submission changes first
+    session.commit()
+    session.refresh(submission)
+    JUDGE_VERDICTS.inc(problem_id=submission.problem_id, status=submission.status.value)
+    
+    verdict_cache.put(
+        submission.problem_id, submission.problem_version, submission.code_hash,
+        CachedVerdict(submission.submission_id, submission.status, submission.score, submission.result)
+    )
+    
+    # Update user score; the change is published to every API process, which broadcasts it
+    with timings.stage("score"):
+        update_user_score(session, submission.user_id, submission.problem_id, score)
+    
+    logger.info(f"Judging completed for submission {submission_id}. Score: {score}/{max_score}, Status: {submission.status}")
+
+#~~~ FUNCTIONS RELATED TO SCORE CALCULATION ~~~#
+# if all test cases pass -> 100; otherwise -> 0 
+def calculate_scores(test_cases:List[dict], problem_max_score:int) -> int:
+    if not test_cases:
+        return 0
+    
+    all_passed = all(tc.get("status") == "AC" for tc in test_cases)
+
+    if all_passed:
+        return problem_max_score    #maybe different problems have different scores assigned to them :)
+    else:
+        return 0
+
+def update_user_score(session: Session, user_id: int, problem_id: int, new_score: int) -> bool:
+    """Raise the user's best score on the problem to new_score if it is higher;
+    True if the best score changed.
+
+    The previous score is read under the row lock, so of two verdicts for the
+    same problem committing at once the second sees the first one's score, and
+    the totals get every improvement exactly once.
+    """
+    table = UserScore.__table__
+    now = datetime.utcnow()
+    # a first score is a plain insert; if another transaction is inserting the
+    # same row, this waits for it to commit and then conflicts
+    inserted = session.exec(
+        insert(table)
+        .values(user_id=user_id, problem_id=problem_id, best_score=new_score, last_updated=now)
+        .on_conflict_do_nothing(index_elements=[table.c.user_id, table.c.problem_id])
+        .returning(table.c.best_score)
+    ).first()
+    if inserted is not None:
+        old_score = 0
+    else:
+        # FOR UPDATE reads the latest committed score, not this statement's
+        # snapshot, and holds the row until commit
+        old_score = session.exec(
+            select(UserScore.best_score)
+            .where(UserScore.user_id == user_id, UserScore.problem_id == problem_id)
+            .with_for_update()
+        ).one()
+        if new_score > old_score:
+            session.exec(
+                update(UserScore)
+                .where(UserScore.user_id == user_id, UserScore.problem_id == problem_id)
+                .values(best_score=new_score, last_updated=now)
+            )
+    changed = new_score > old_score
+    
+    # keep the user's totals in step, in the same transaction, and tell every
+    # API process about them once it commits
+    if changed:
+        total_score, problems_solved = _add_to_totals(
+            session, user_id, new_score - old_score, 1 if old_score <= 0 < new_score else 0
+        )
+        leaderboard_pubsub.publish(
+            session, {"user_id": user_id, "total_score": total_score, "problems_solved": problems_solved}
+        )
+    
+    session.commit()
+    return changed
+
+def _add_to_totals(session: Session, user_id: int, score_delta: int, solved_delta: int) -> Tuple[int, int]:
+    """Add the deltas to the user's totals; the new (total_score, problems_solved)"""
+    table = UserTotal.__table__
+    stmt = insert(table).values(
+        user_id=user_id, total_score=score_delta, problems_solved=solved_delta, last_updated=datetime.utcnow()
+    )
+    # relative update, so concurrent changes to other problems of the same user are not lost
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id],
+        set_={
+            "total_score": table.c.total_score + score_delta,
+            "problems_solved": table.c.problems_solved + solved_delta,
+            "last_updated": stmt.excluded.last_updated
+        }
+    ).returning(table.c.total_score, table.c.problems_solved)
+    total_score, problems_solved = session.exec(stmt).one()
+    return total_score, problems_solved
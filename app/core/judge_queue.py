@@ -0,0 +1,140 @@
+from sqlmodel import Session, select, func, or_
+from sqlalchemy import delete
+from app.core.config import settings
+from app.models import Submission, SubmissionStatus, SubmissionTestResult
+from datetime import datetime, timedelta
+from typing import Optional
+
+# The judge queue lives in the submissions table itself: a submission is queued
+# while status == PENDING and queued_at is set. Workers claim rows with
+# FOR UPDATE SKIP LOCKED and hold a time-limited lease, so a crashed worker's
+# submission becomes claimable again once its lease expires.
+
+def enqueue(session: Session, submission: Submission):
+    """Put a submission (back) on the judge queue"""
+    submission.status = SubmissionStatus.PENDING
+    submission.queued_at = datetime.utcnow()
+    submission.lease_owner = None
+    submission.lease_expires_at = None
+    submission.attempts = 0
+    submission.trace = None
+    session.add(submission)
+    # a re-judge replaces the per-test results of the previous run
+    session.exec(
+        delete(SubmissionTestResult).where(SubmissionTestResult.submission_id == submission.submission_id)
+    )
+    session.commit()
+
+def running(submission: Submission) -> bool:
+    """Whether a worker currently holds a live lease on the submission"""
+    return (
+        submission.status == SubmissionStatus.PENDING
+        and submission.lease_owner is not None
+        and submission.lease_expires_at is not None
+        and submission.lease_expires_at > datetime.utcnow()
+    )
+
+def lock_leased(session: Session, submission_id: int, worker_id: Optional[str]) -> Optional[Submission]:
+    """Lock the submission for writing results, or return None if `worker_id`
+    no longer holds its lease (re-queued, or taken over after expiry)"""
+    submission = session.exec(
+        select(Submission)
+        .where(Submission.submission_id == submission_id)
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    ).first()
+    if not submission or (worker_id is not None and submission.lease_owner != worker_id):
+        session.rollback()
+        return None
+    return submission
+
+def _claimable():
+    now = datetime.utcnow()
+    return (
+        Submission.status == SubmissionStatus.PENDING,
+        Submission.queued_at.is_not(None),
+        or_(Submission.lease_expires_at.is_(None), Submission.lease_expires_at < now),
+    )
+
+def claim(session: Session, worker_id: str) -> Optional[Submission]:
+    """Lease the oldest claimable submission to `worker_id`, or return None"""
+    submission = session.exec(
+        select(Submission)
+        .where(*_claimable(), Submission.attempts < settings.JUDGE_MAX_ATTEMPTS)
+        .order_by(Submission.queued_at)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    ).first()
+
+    if not submission:
+        session.rollback()
+        return None
+
+    submission.lease_owner = worker_id
+    submission.lease_expires_at = datetime.utcnow() + timedelta(seconds=settings.JUDGE_LEASE_SECONDS)
+    submission.attempts += 1
+    session.add(submission)
+    session.commit()
+    session.refresh(submission)
+    return submission
+
+def complete(session: Session, submission_id: int, worker_id: str, trace: Optional[str] = None):
+    """Take a judged submission off the queue, keeping the judge run's trace
+    (only while `worker_id` still holds the lease)"""
+    submission = lock_leased(session, submission_id, worker_id)
+    if not submission:
+        return
+    submission.trace = trace
+    submission.queued_at = None
+    submission.lease_owner = None
+    submission.lease_expires_at = None
+    session.add(submission)
+    session.commit()
+
+def fail(session: Session, submission_id: int, worker_id: str, error: str, trace: Optional[str] = None):
+    """Release a submission after a failed attempt; it is retried after a backoff
+    until JUDGE_MAX_ATTEMPTS is reached, then marked as an internal error
+    (only while `worker_id` still holds the lease)"""
+    submission = lock_leased(session, submission_id, worker_id)
+    if not submission:
+        return
+
+    submission.trace = trace
+    submission.lease_owner = None
+    if submission.attempts >= settings.JUDGE_MAX_ATTEMPTS:
+        submission.status = SubmissionStatus.INTERNAL_ERR
+        submission.result = f"Judging failed after {submission.attempts} attempts: {error}"
+        submission.queued_at = None
+        submission.lease_expires_at = None
+    else:
+        submission.lease_expires_at = datetime.utcnow() + timedelta(seconds=settings.JUDGE_RETRY_BACKOFF)
+    session.add(submission)
+    session.commit()
+
+def expire_exhausted(session: Session) -> int:
+    """Mark submissions whose last allowed attempt lost its lease (e.g. the worker
+    died mid-run) as internal errors. Returns how many were expired."""
+    stale = session.exec(
+        select(Submission)
+        .where(*_claimable(), Submission.attempts >= settings.JUDGE_MAX_ATTEMPTS)
+        .with_for_update(skip_locked=True)
+    ).all()
+
+    for submission in stale:
+        submission.status = SubmissionStatus.INTERNAL_ERR
+        submission.result = f"Judging did not finish after {submission.attempts} attempts"
+        submission.queued_at = None
+        submission.lease_owner = None
+        submission.lease_expires_at = None
+        session.add(submission)
+    session.commit()
+    return len(stale)
+
+def queue_depth(session: Session) -> int:
+    """Number of submissions waiting for (or currently in) judging"""
+    return session.exec(
+        select(func.count(Submission.submission_id)).where(
+            Submission.status == SubmissionStatus.PENDING,
+            Submission.queued_at.is_not(None),
+        )
+    ).one()
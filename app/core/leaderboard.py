@@ -1,68 +1,234 @@
 from sqlmodel import Session, select, func
-from app.models import User, UserScore, Submission
-from typing import List, Dict
+from app.core.database import engine
+from app.core.config import settings
+from app.core.fanout import Fanout
+from app.core.metrics import LEADERBOARD_BROADCASTS
+from app.core.leaderboard_index import LeaderboardIndex
+from app.core.leaderboard_pubsub import LeaderboardPubSub
+from app.models import User, UserTotal
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, List, Dict, NamedTuple, Optional, Tuple
 import asyncio
-from fastapi import WebSocket, WebSocketDisconnect
+import hashlib
+import json
+from fastapi import WebSocket
+
+# Websocket protocol (/ws/leaderboard):
+#   server -> client  {"type": "snapshot", "version": v, "rows": [...all rows]}
+#                     {"type": "diff", "from_version": u, "version": v, "rows": [...changed rows]}
+#   client -> server  "refresh" / "resync": send a new snapshot
+# A client applies a diff only if its version equals from_version (rows are
+# replaced by user_id), ignores diffs it is already past, and asks for a
+# resync on a gap.
+
+# distinct (limit, offset) pages kept per version before the cache starts over
+MAX_CACHED_PAGES = 64
+
+class LeaderboardPage(NamedTuple):
+    version: int
+    etag: str
+    total: int
+    body: bytes
+
+class BroadcastScheduler:
+    """Coalesces leaderboard changes into at most one broadcast per `interval`.
+
+    Changes only mark the leaderboard dirty. The first change after a quiet
+    period is broadcast right away; changes arriving while the scheduler
+    waits out the interval are merged into a single broadcast after it.
+    """
+    
+    def __init__(self, broadcast: Callable[[], Awaitable[None]], interval: float):
+        self._broadcast = broadcast
+        self.interval = interval
+        self._dirty = asyncio.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    def mark_dirty(self):
+        """Request a broadcast; safe to call from any thread"""
+        loop = self._loop
+        if loop is None:
+            return  # not running yet; the first broadcast starts from the index anyway
+        try:
+            on_loop = asyncio.get_running_loop() is loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            self._dirty.set()
+        else:
+            loop.call_soon_threadsafe(self._dirty.set)
+    
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        while True:
+            await self._dirty.wait()
+            self._dirty.clear()
+            await self._broadcast()
+            await asyncio.sleep(self.interval)
 
 class LeaderboardService:
     def __init__(self):
-        self.active_connections: List[WebSocket] = []
+        self.fanout = Fanout(settings.LEADERBOARD_CLIENT_QUEUE, settings.LEADERBOARD_SEND_TIMEOUT)
+        self.scheduler = BroadcastScheduler(self.broadcast_leaderboard, settings.LEADERBOARD_BROADCAST_INTERVAL)
+        self.index = LeaderboardIndex()
+        # newest user_totals.last_updated applied to the index
+        self._synced_until: Optional[datetime] = None
+        # what clients were last sent; new clients start from here so the
+        # next diff always applies to what they have
+        self._published_version = 0
+        self._published_rows: List[Dict] = []
+        self._published: Dict[int, Dict] = {}
+        # serialized snapshot message of the published version, built on demand
+        self._snapshot_text: Optional[str] = None
+        # serialized GET /leaderboard/ pages of one version, by (limit, offset)
+        self._pages_version = -1
+        self._pages: Dict[Tuple[Optional[int], int], LeaderboardPage] = {}
     
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        self.fanout.add(websocket)
+        self.send_snapshot(websocket)
     
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-    
-    async def broadcast_leaderboard(self, session: Session):
-        leaderboard = self.get_leaderboard(session)
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(leaderboard)
-            except:
-                pass
-    
-    def get_leaderboard(self, session: Session) -> List[Dict]:
-        # note: subquery is implemented to consider only problems with score > 0
-        solved_subquery = (
-            select(
-                UserScore.user_id,
-                func.count(UserScore.problem_id).label("problems_solved")
+        self.fanout.remove(websocket)
+    
+    def send_snapshot(self, websocket: WebSocket):
+        """Queue the published leaderboard for one client (behind any queued diffs)"""
+        self.fanout.send(websocket, self.snapshot_text())
+    
+    def snapshot_text(self) -> str:
+        if self._snapshot_text is None:
+            self._snapshot_text = json.dumps(
+                {"type": "snapshot", "version": self._published_version, "rows": self._published_rows}
             )
-            .where(UserScore.best_score > 0)
-            .group_by(UserScore.user_id)
-            .subquery()
-        )
+        return self._snapshot_text
+    
+    def publish(self) -> Optional[Dict]:
+        """Advance the published leaderboard to the index; the diff to send, or
+        None if nothing changed"""
+        version, rows = self.index.snapshot()
+        if version == self._published_version:
+            return None
         
-        query = (
-            select(
-                User.user_id,
-                User.username,
-                func.coalesce(func.sum(UserScore.best_score), 0).label("total_score"),
-                func.coalesce(solved_subquery.c.problems_solved, 0).label("problems_solved")
-            )
-
-            .select_from(User)
-            .outerjoin(UserScore, User.user_id == UserScore.user_id)
-            .outerjoin(solved_subquery, User.user_id == solved_subquery.c.user_id)
-            .group_by(User.user_id, User.username, solved_subquery.c.problems_solved)
-            .order_by(func.coalesce(func.sum(UserScore.best_score), 0).desc())
-        )
+        current = {row["user_id"]: row for row in rows}
+        # a user moving up shifts the rank of everyone they passed, so rows are
+        # compared whole rather than taken from the score change alone
+        changed = [row for row in rows if self._published.get(row["user_id"]) != row]
+        message = {
+            "type": "diff",
+            "from_version": self._published_version,
+            "version": version,
+            "rows": changed
+        }
+        self._published_version = version
+        self._published_rows = rows
+        self._published = current
+        self._snapshot_text = None
+        return message
+    
+    async def broadcast_leaderboard(self):
+        message = self.publish()
+        if message is None:
+            return
+        # serialized once; each client's sender task delivers it at its own pace
+        self.fanout.publish(json.dumps(message))
+        LEADERBOARD_BROADCASTS.inc()
+    
+    def totals_changed(self, user_id: int, total_score: int, problems_solved: int):
+        """Apply totals written by this process without waiting for the next
+        sync; safe to call from any thread"""
+        if self.index.set_totals(user_id, total_score, problems_solved):
+            self.scheduler.mark_dirty()
+    
+    async def listen(self, pubsub: LeaderboardPubSub):
+        """Apply totals published by any process (judge workers, other API
+        processes) as they arrive"""
+        await pubsub.listen(self._totals_published)
+    
+    def _totals_published(self, change: Dict):
+        self.totals_changed(change["user_id"], change["total_score"], change["problems_solved"])
+    
+    def load(self):
+        """Build the leaderboard index from the database (once at startup)"""
+        with Session(engine) as session:
+            self._synced_until = session.exec(select(func.max(UserTotal.last_updated))).one()
+            self.index.load(session)
+        self.publish()
+    
+    def sync(self) -> bool:
+        """Apply users and totals written since the last sync (e.g. by judge
+        workers in other processes); True if the leaderboard changed"""
+        with Session(engine) as session:
+            users = session.exec(
+                select(User.user_id, User.username).where(User.user_id > self.index.max_user_id)
+            ).all()
+            query = select(UserTotal.user_id, UserTotal.total_score, UserTotal.problems_solved, UserTotal.last_updated)
+            if self._synced_until is not None:
+                # last_updated is stamped before its transaction commits, so a row
+                # stamped earlier can become visible after a later one was synced;
+                # re-reading a trailing window catches it (applying twice is harmless)
+                lag = timedelta(seconds=settings.LEADERBOARD_SYNC_LAG)
+                query = query.where(UserTotal.last_updated >= self._synced_until - lag)
+            totals = session.exec(query).all()
         
-        results = session.exec(query).all()
+        changed = False
+        for user_id, username in users:
+            changed |= self.index.add_user(user_id, username)
+        for user_id, total_score, problems_solved, last_updated in totals:
+            changed |= self.index.set_totals(user_id, total_score, problems_solved)
+            if self._synced_until is None or last_updated > self._synced_until:
+                self._synced_until = last_updated
+        return changed
+    
+    async def watch_scores(self, interval: float):
+        """Keep the index up to date and schedule a broadcast whenever it changes.
+
+        Scores are written by judge workers in other processes. Their changes
+        normally arrive through the pub/sub (see listen); polling catches the
+        ones it missed, e.g. while its connection was down, and new users.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            changed = await asyncio.to_thread(self.sync)
+            if changed:
+                # published even without listeners, so new clients start current
+                self.scheduler.mark_dirty()
+    
+    def get_leaderboard(self, limit: Optional[int] = None, offset: int = 0) -> List[Dict]:
+        return self.index.top(limit, offset)
+    
+    def get_leaderboard_page(self, limit: Optional[int] = None, offset: int = 0) -> LeaderboardPage:
+        """The page serialized to JSON, cached until the leaderboard changes.
         
-        leaderboard = []
-        for rank, (user_id, username, total_score, problems_solved) in enumerate(results, 1):
-            leaderboard.append({
-                "rank": rank,
-                "user_id": user_id,
-                "username": username,
-                "total_score": total_score,
-                "problems_solved": problems_solved
-            })
+        Its ETag is a hash of what is sent, not the index version, which only
+        counts this process's changes: every API process (and a restarted one)
+        tags the same page the same way, whichever one a client reaches.
+        """
+        key = (limit, offset)
+        page = self._pages.get(key)
+        if page is not None and page.version == self.index.version:
+            return page
         
-        return leaderboard
+        version, total, rows = self.index.page(limit, offset)
+        body = json.dumps(rows).encode()
+        digest = hashlib.blake2b(body, digest_size=16)
+        digest.update(f":{total}".encode())  # X-Total-Count is part of the response too
+        page = LeaderboardPage(version, f'"{digest.hexdigest()}"', total, body)
+        if version != self._pages_version or len(self._pages) >= MAX_CACHED_PAGES:
+            self._pages = {}
+            self._pages_version = version
+        if version == self._pages_version:
+            self._pages[key] = page
+        return page
+    
+    def get_user_rank(self, user_id: int) -> Optional[Dict]:
+        return self.index.rank(user_id)
+    
+    def get_neighbors(self, user_id: int, radius: int) -> Optional[List[Dict]]:
+        return self.index.around(user_id, radius)
+    
+    def count(self) -> int:
+        return len(self.index)
 
 # this is the GLOBAL instance
-leaderboard_service = LeaderboardService()
\ No newline at end of file
+leaderboard_service = LeaderboardService()
@@ -0,0 +1,144 @@
+from sqlmodel import Session, select, func
+from app.models import User, UserTotal
+from bisect import bisect_left, insort
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import threading
+
+@dataclass
+class LeaderboardEntry:
+    user_id: int
+    username: str
+    total_score: int = 0
+    problems_solved: int = 0
+
+    def as_dict(self, rank: int) -> Dict:
+        return {
+            "rank": rank,
+            "user_id": self.user_id,
+            "username": self.username,
+            "total_score": self.total_score,
+            "problems_solved": self.problems_solved
+        }
+
+class LeaderboardIndex:
+    """In-memory ranking of every user by (total score desc, user id).
+
+    Loaded once from users and user_totals; afterwards a changed total moves
+    a single user within a sorted key list found by binary search, so top-K
+    and rank queries never touch the database.
+    """
+
+    def __init__(self):
+        self._entries: Dict[int, LeaderboardEntry] = {}
+        # (-total_score, user_id) of every user, sorted: position + 1 is the rank
+        self._keys: List[Tuple[int, int]] = []
+        self._lock = threading.Lock()
+        self.max_user_id = 0
+        # bumped on every change, so equal versions mean equal leaderboards
+        self.version = 0
+
+    @staticmethod
+    def _key(entry: LeaderboardEntry) -> Tuple[int, int]:
+        return (-entry.total_score, entry.user_id)
+
+    def load(self, session: Session):
+        """(Re)build the index from the database"""
+        rows = session.exec(
+            select(
+                User.user_id,
+                User.username,
+                func.coalesce(UserTotal.total_score, 0),
+                func.coalesce(UserTotal.problems_solved, 0)
+            )
+            .select_from(User)
+            .outerjoin(UserTotal, User.user_id == UserTotal.user_id)
+        ).all()
+        entries = {
+            user_id: LeaderboardEntry(user_id, username, total_score, problems_solved)
+            for user_id, username, total_score, problems_solved in rows
+        }
+
+        with self._lock:
+            self._entries = entries
+            self._keys = sorted(self._key(entry) for entry in entries.values())
+            self.max_user_id = max(entries, default=0)
+            self.version += 1
+
+    def add_user(self, user_id: int, username: str) -> bool:
+        """Add a user with no scores yet; True if the user was new"""
+        with self._lock:
+            if user_id in self._entries:
+                return False
+            entry = self._entries[user_id] = LeaderboardEntry(user_id, username)
+            insort(self._keys, self._key(entry))
+            self.max_user_id = max(self.max_user_id, user_id)
+            self.version += 1
+            return True
+
+    def set_totals(self, user_id: int, total_score: int, problems_solved: int) -> bool:
+        """Apply a user's current totals; True if the user's row changed"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return False
+            if (entry.total_score, entry.problems_solved) == (total_score, problems_solved):
+                return False
+            old_key = self._key(entry)
+            entry.total_score = total_score
+            entry.problems_solved = problems_solved
+            del self._keys[bisect_left(self._keys, old_key)]
+            insort(self._keys, self._key(entry))
+            self.version += 1
+            return True
+
+    def top(self, limit: Optional[int] = None, offset: int = 0) -> List[Dict]:
+        """Rows ranked offset + 1 to offset + limit (to the end if limit is None)"""
+        with self._lock:
+            end = None if limit is None else offset + limit
+            return [
+                self._entries[user_id].as_dict(rank)
+                for rank, (_, user_id) in enumerate(self._keys[offset:end], offset + 1)
+            ]
+
+    def page(self, limit: Optional[int] = None, offset: int = 0) -> Tuple[int, int, List[Dict]]:
+        """Version, number of users and the rows of top(limit, offset), taken together"""
+        with self._lock:
+            end = None if limit is None else offset + limit
+            return self.version, len(self._keys), [
+                self._entries[user_id].as_dict(rank)
+                for rank, (_, user_id) in enumerate(self._keys[offset:end], offset + 1)
+            ]
+
+    def snapshot(self) -> Tuple[int, List[Dict]]:
+        """Version and all rows, taken together"""
+        with self._lock:
+            return self.version, [
+                self._entries[user_id].as_dict(rank)
+                for rank, (_, user_id) in enumerate(self._keys, 1)
+            ]
+
+    def rank(self, user_id: int) -> Optional[Dict]:
+        """The user's row with its rank, or None for an unknown user"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            return entry.as_dict(bisect_left(self._keys, self._key(entry)) + 1)
+
+    def around(self, user_id: int, radius: int) -> Optional[List[Dict]]:
+        """The user's row and up to `radius` rows above and below it, or None
+        for an unknown user"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            position = bisect_left(self._keys, self._key(entry))
+            start = max(0, position - radius)
+            return [
+                self._entries[other_id].as_dict(rank)
+                for rank, (_, other_id) in enumerate(self._keys[start:position + radius + 1], start + 1)
+            ]
+
+    def __len__(self) -> int:
+        return len(self._keys)
@@ -0,0 +1,205 @@
+from sqlalchemy import event
+from sqlalchemy.orm import Session as OrmSession
+from sqlmodel import Session, select, func
+from app.core.config import settings
+from app.core.database import engine
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple, Type
+import asyncio
+import json
+import logging
+import os
+import secrets
+import socket
+
+logger = logging.getLogger(__name__)
+
+# Leaderboard change events are small dicts,
+#   {"user_id": u, "total_score": t, "problems_solved": p}
+# published by whichever process wrote the totals (API or judge worker) and
+# delivered to every API process, which applies them to its own index and
+# fans the result out to its own websockets. Delivery is best effort: the
+# API processes still poll user_totals, which repairs anything missed.
+
+Handler = Callable[[Dict], None]
+
+# events published in a session's transaction, sent once it commits
+_PENDING = "leaderboard_events"
+
+class LeaderboardPubSub:
+    """Carries leaderboard change events between processes"""
+    name: str
+
+    def publish(self, session: Session, change: Dict):
+        """Send `change` once the session's current transaction commits
+        (dropped if it rolls back)"""
+        session.info.setdefault(_PENDING, []).append((self, change))
+
+    def send(self, changes: List[Dict]):
+        """Deliver committed changes to the subscribers"""
+        raise NotImplementedError
+
+    async def listen(self, handler: Handler):
+        """Call `handler` with every change published from now on, until cancelled"""
+        raise NotImplementedError
+
+@event.listens_for(OrmSession, "after_commit")
+def _send_pending(session: OrmSession):
+    pending: List[Tuple[LeaderboardPubSub, Dict]] = session.info.pop(_PENDING, [])
+    for pubsub, change in pending:
+        try:
+            pubsub.send([change])
+        except Exception:
+            # the write itself succeeded; polling picks the change up instead
+            logger.exception(f"Publishing a leaderboard change over {pubsub.name} failed")
+
+@event.listens_for(OrmSession, "after_soft_rollback")
+def _drop_pending(session: OrmSession, previous_transaction):
+    session.info.pop(_PENDING, None)
+
+class MemoryPubSub(LeaderboardPubSub):
+    """Subscribers in this process only (tests, a single API process in development).
+
+    Judge workers are separate processes, so only verdict-cache hits of this
+    API process come through here; worker results reach it by polling alone.
+    """
+    name = "memory"
+
+    def __init__(self):
+        self._subscribers: List[Tuple[asyncio.AbstractEventLoop, Handler]] = []
+
+    def send(self, changes: List[Dict]):
+        for loop, handler in list(self._subscribers):
+            for change in changes:
+                loop.call_soon_threadsafe(handler, change)
+
+    async def listen(self, handler: Handler):
+        subscriber = (asyncio.get_running_loop(), handler)
+        self._subscribers.append(subscriber)
+        try:
+            await asyncio.Future()
+        finally:
+            self._subscribers.remove(subscriber)
+
+class PostgresPubSub(LeaderboardPubSub):
+    """PostgreSQL LISTEN/NOTIFY, so every process sharing the database hears
+    every change (also across hosts).
+
+    The NOTIFY is part of the transaction that writes the totals, so it is
+    delivered only if that commits, and in commit order.
+    """
+    name = "postgres"
+    channel = "leaderboard"
+    reconnect_delay = 5.0
+
+    def publish(self, session: Session, change: Dict):
+        session.exec(select(func.pg_notify(self.channel, json.dumps(change))))
+
+    def send(self, changes: List[Dict]):
+        with Session(engine) as session:
+            for change in changes:
+                self.publish(session, change)
+            session.commit()
+
+    async def listen(self, handler: Handler):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                connection = await asyncio.to_thread(self._connect)
+            except Exception:
+                logger.exception("Could not listen for leaderboard changes")
+                await asyncio.sleep(self.reconnect_delay)
+                continue
+            readable = asyncio.Event()
+            loop.add_reader(connection.fileno(), readable.set)
+            try:
+                while True:
+                    await readable.wait()
+                    readable.clear()
+                    connection.poll()
+                    while connection.notifies:
+                        handler(json.loads(connection.notifies.pop(0).payload))
+            except Exception:
+                logger.exception("Lost the leaderboard LISTEN connection")
+            finally:
+                loop.remove_reader(connection.fileno())
+                connection.close()
+            await asyncio.sleep(self.reconnect_delay)
+
+    def _connect(self):
+        # a connection of its own, taken out of the pool since it stays in LISTEN
+        pooled = engine.raw_connection()
+        pooled.detach()
+        connection = pooled.driver_connection
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute(f"LISTEN {self.channel}")
+        return connection
+
+class UnixSocketPubSub(LeaderboardPubSub):
+    """Datagram Unix sockets in a shared directory, for processes on one host
+    without a database that can NOTIFY (tests, local runs).
+
+    Every listener binds its own socket there; a publisher sends each change
+    to all of them and removes sockets nobody is reading any more.
+    """
+    name = "unix"
+    max_datagram = 64 * 1024
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+
+    def send(self, changes: List[Dict]):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sender:
+            sender.setblocking(False)
+            for path in self.directory.glob("*.sock"):
+                for change in changes:
+                    try:
+                        sender.sendto(json.dumps(change).encode(), str(path))
+                    except (ConnectionRefusedError, FileNotFoundError):
+                        path.unlink(missing_ok=True)  # its listener is gone
+                        break
+                    except BlockingIOError:
+                        break  # listener is behind; it catches up by polling
+
+    async def listen(self, handler: Handler):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{os.getpid()}-{secrets.token_hex(4)}.sock"
+        receiver = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        receiver.setblocking(False)
+        receiver.bind(str(path))
+        loop = asyncio.get_running_loop()
+        readable = asyncio.Event()
+        loop.add_reader(receiver.fileno(), readable.set)
+        try:
+            while True:
+                await readable.wait()
+                readable.clear()
+                while True:
+                    try:
+                        data = receiver.recv(self.max_datagram)
+                    except BlockingIOError:
+                        break
+                    handler(json.loads(data))
+        finally:
+            loop.remove_reader(receiver.fileno())
+            receiver.close()
+            path.unlink(missing_ok=True)
+
+PUBSUB_BACKENDS: Dict[str, Type[LeaderboardPubSub]] = {
+    MemoryPubSub.name: MemoryPubSub,
+    PostgresPubSub.name: PostgresPubSub,
+    UnixSocketPubSub.name: UnixSocketPubSub,
+}
+
+def create_pubsub() -> LeaderboardPubSub:
+    """Pub/sub backend selected by LEADERBOARD_PUBSUB"""
+    if settings.LEADERBOARD_PUBSUB == UnixSocketPubSub.name:
+        return UnixSocketPubSub(settings.LEADERBOARD_PUBSUB_DIR)
+    try:
+        return PUBSUB_BACKENDS[settings.LEADERBOARD_PUBSUB]()
+    except KeyError:
+        raise ValueError(f"Unknown leaderboard pub/sub backend: {settings.LEADERBOARD_PUBSUB}") from None
+
+# this is the GLOBAL instance, shared by publishers and the listener of the process
+leaderboard_pubsub = create_pubsub()
@@ -0,0 +1,291 @@
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import fcntl
+import json
+import os
+import threading
+
+# Minimal Prometheus-style metrics (text exposition format 0.0.4).
+#
+# Judging happens in worker processes and requests are spread over several API
+# processes, while a scrape reaches just one of them. So every process
+# periodically writes a snapshot of its metrics to METRICS_DIR and the scraped
+# process adds them up. Counters and histograms of exited processes keep
+# counting toward the totals: the scraped process folds their snapshots into
+# a single retired.json and deletes them. Their gauges are dropped.
+
+# counters and histograms of every exited process, added up
+RETIRED = "retired"
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), scraped: bool = False):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        # set by the scraped process for the whole system, so it is left out
+        # of snapshots (other processes would add in stale copies)
+        self.scraped = scraped
+        self._values: Dict[LabelValues, object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, object]) -> LabelValues:
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def snapshot(self) -> List[list]:
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def merge(self, values: Dict[LabelValues, object], snapshot: List[list]):
+        for key, value in snapshot:
+            key = tuple(key)
+            values[key] = values[key] + value if key in values else value
+
+    def samples(self, key: LabelValues, value) -> Iterable[Tuple[str, str, float]]:
+        yield self.name, _format_labels(self.labels, key), value
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            # per-bucket counts (not cumulative), then +Inf, sum and count
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            else:
+                state[len(self.buckets)] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def snapshot(self) -> List[list]:
+        with self._lock:
+            return [[list(key), list(state)] for key, state in self._values.items()]
+
+    def merge(self, values: Dict[LabelValues, object], snapshot: List[list]):
+        for key, state in snapshot:
+            key = tuple(key)
+            if key in values:
+                values[key] = [a + b for a, b in zip(values[key], state)]
+            else:
+                values[key] = list(state)
+
+    def samples(self, key: LabelValues, state) -> Iterable[Tuple[str, str, float]]:
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), state):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            yield f"{self.name}_bucket", _format_labels(self.labels + ("le",), key + (le,)), cumulative
+        yield f"{self.name}_sum", _format_labels(self.labels, key), state[-2]
+        yield f"{self.name}_count", _format_labels(self.labels, key), state[-1]
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+def _format_value(value: float) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self) -> Dict[str, List[list]]:
+        return {name: metric.snapshot() for name, metric in self.metrics.items() if not metric.scraped}
+
+    def write_snapshot(self, directory: Path, role: str) -> Dict[str, List[list]]:
+        """Atomically write this process's metrics to `directory`; the snapshot
+        written.
+
+        The file is named after the role, pid and the process's start time: a
+        pid alone is reused, and a new process would overwrite the counters of
+        the old one before they were retired.
+        """
+        snapshot = self.snapshot()
+        pid = os.getpid()
+        start = _start_time(pid)
+        name = f"{role}-{pid}-{start}"
+        directory.mkdir(parents=True, exist_ok=True)
+        _write_json(directory / f"{name}.json", {"pid": pid, "start": start, "metrics": snapshot})
+        return snapshot
+
+    def render(self, directory: Optional[Path] = None, own: Optional[Dict[str, List[list]]] = None) -> str:
+        """Text exposition of this process's metrics (`own` if given, e.g. the
+        snapshot just written) plus every other snapshot in `directory`"""
+        own = dict(self.snapshot() if own is None else own)
+        own.update({name: metric.snapshot() for name, metric in self.metrics.items() if metric.scraped})
+        snapshots = [(True, own)]
+        if directory is not None and directory.is_dir():
+            snapshots += self._collect(directory)
+
+        lines = []
+        for name, metric in self.metrics.items():
+            values: Dict[LabelValues, object] = {}
+            for alive, snapshot in snapshots:
+                if metric.type == "gauge" and not alive:
+                    continue
+                if metric.scraped and snapshot is not own:
+                    continue
+                metric.merge(values, snapshot.get(name, []))
+
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            for key in sorted(values):
+                for sample, labels, value in metric.samples(key, values[key]):
+                    lines.append(f"{sample}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def _collect(self, directory: Path) -> List[Tuple[bool, Dict[str, List[list]]]]:
+        """(alive, metrics) of the other processes' snapshots in `directory`,
+        after folding those of exited processes into the retired snapshot"""
+        pid = os.getpid()
+        start = _start_time(pid)
+        # one scraped process at a time, so no snapshot is folded in twice or
+        # read both on its own and as part of the retired one
+        with open(directory / ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            retired = _read_json(directory / f"{RETIRED}.json") or {}
+            # files already folded in; only deleting them may have failed
+            folded = [name for name in retired.get("folded", []) if (directory / name).exists()]
+            retired_metrics = retired.get("metrics", {})
+            live = []
+            exited = []
+            for path in directory.glob("*.json"):
+                if path.stem == RETIRED or path.name in folded:
+                    continue
+                data = _read_json(path)
+                if data is None or (data.get("pid"), data.get("start")) == (pid, start):
+                    continue
+                if _alive(data.get("pid"), data.get("start")):
+                    live.append((True, data.get("metrics", {})))
+                else:
+                    exited.append((path, data.get("metrics", {})))
+
+            if exited:
+                retired_metrics = self._fold(retired_metrics, [snapshot for _, snapshot in exited])
+                folded += [path.name for path, _ in exited]
+                # recorded before deleting, so a crash in between cannot count them twice
+                _write_json(directory / f"{RETIRED}.json", {"folded": folded, "metrics": retired_metrics})
+            for name in folded:
+                try:
+                    (directory / name).unlink()
+                except FileNotFoundError:
+                    pass
+        return live + [(False, retired_metrics)]
+
+    def _fold(self, retired: Dict[str, List[list]], snapshots: List[Dict[str, List[list]]]) -> Dict[str, List[list]]:
+        """`retired` with the counters and histograms of `snapshots` added"""
+        folded = dict(retired)
+        for name, metric in self.metrics.items():
+            if metric.type == "gauge" or metric.scraped:
+                continue
+            values: Dict[LabelValues, object] = {}
+            for snapshot in [retired] + snapshots:
+                metric.merge(values, snapshot.get(name, []))
+            folded[name] = [[list(key), value] for key, value in values.items()]
+        return folded
+
+def _read_json(path: Path) -> Optional[Dict]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_json(path: Path, data: Dict):
+    tmp = path.with_name(f".{path.stem}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+def _start_time(pid: int) -> Optional[int]:
+    """Start time of a running process in clock ticks after boot, or None"""
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            # starttime is field 22, counted from the pid
+            return int(f.read().rsplit(b")", 1)[1].split()[19])
+    except (OSError, ValueError, IndexError):
+        return None
+
+def _alive(pid: Optional[int], start: Optional[int]) -> bool:
+    """Whether the process that wrote a snapshot is still running (and not
+    just some later process with the same pid)"""
+    if not pid or start is None:
+        return False
+    return _start_time(pid) == start
+
+# this is the GLOBAL registry of the process
+registry = Registry()
+
+JUDGE_QUEUE_DEPTH = registry.register(Gauge(
+    "judge_queue_depth", "Submissions waiting for or currently in judging", scraped=True))
+JUDGES_IN_FLIGHT = registry.register(Gauge(
+    "judge_in_flight", "Submissions being judged right now"))
+BOX_POOL_SIZE = registry.register(Gauge(
+    "judge_box_pool_size", "Sandbox boxes configured for this host", scraped=True))
+BOX_POOL_IN_USE = registry.register(Gauge(
+    "judge_box_pool_in_use", "Sandbox boxes currently leased"))
+JUDGE_STAGE_SECONDS = registry.register(Histogram(
+    "judge_stage_seconds", "Time spent in each judge stage", ["stage"]))
+JUDGE_SECONDS = registry.register(Histogram(
+    "judge_seconds", "Time to judge one submission, claim to completion",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)))
+JUDGE_VERDICTS = registry.register(Counter(
+    "judge_verdicts_total", "Judged submissions by problem and verdict", ["problem_id", "status"]))
+VERDICT_CACHE_HITS = registry.register(Counter(
+    "judge_verdict_cache_hits_total", "Submissions answered from the verdict cache", ["problem_id"]))
+HTTP_REQUEST_SECONDS = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by router", ["router", "method", "status"]))
+LEADERBOARD_CLIENTS = registry.register(Gauge(
+    "leaderboard_clients", "Websocket clients subscribed to leaderboard updates"))
+LEADERBOARD_CLIENTS_DROPPED = registry.register(Counter(
+    "leaderboard_clients_dropped_total", "Leaderboard websocket clients disconnected by the server", ["reason"]))
+LEADERBOARD_BROADCASTS = registry.register(Counter(
+    "leaderboard_broadcasts_total", "Leaderboard diffs sent to websocket clients"))
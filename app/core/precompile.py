@@ -0,0 +1,135 @@
+from app.core.config import settings
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional, Tuple
+import asyncio
+import importlib.util
+import logging
+import marshal
+import math
+import multiprocessing
+import resource
+import subprocess
+import threading
+import traceback
+
+logger = logging.getLogger(__name__)
+
+# Submissions are compiled before they reach the sandbox: code that does not
+# parse fails right away with COMPILE_ERR, and code that does is handed to the
+# sandbox as bytecode so the interpreter does not compile it again per test.
+# compile() on untrusted input can still eat memory or CPU, so it runs in a
+# small pool of worker processes with tight resource limits.
+
+# the error echoes the offending line, which may be arbitrarily long
+MAX_ERROR_LENGTH = 2000
+
+@dataclass
+class CompileResult:
+    ok: bool
+    # solution.pyc contents, or None if the sandbox should get the source
+    bytecode: Optional[bytes] = None
+    error: Optional[str] = None
+
+def _limit_resources():
+    memory = settings.COMPILE_MEMORY_LIMIT
+    resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+
+def _limit_cpu():
+    # RLIMIT_CPU counts the whole life of the (long-lived) worker, so each
+    # compile gets COMPILE_TIMEOUT seconds on top of what it has used so far;
+    # only the soft limit moves, since a lowered hard limit cannot be raised again
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = math.ceil(usage.ru_utime + usage.ru_stime + settings.COMPILE_TIMEOUT)
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu, resource.getrlimit(resource.RLIMIT_CPU)[1]))
+
+def _compile(code: str) -> Tuple[bool, bytes]:
+    """Runs in a compile worker: marshalled code object, or the error message"""
+    _limit_cpu()
+    try:
+        compiled = compile(code, "solution.py", "exec", dont_inherit=True)
+    except (SyntaxError, ValueError) as e:
+        message = "".join(traceback.format_exception_only(type(e), e)).strip()
+        return False, message[:MAX_ERROR_LENGTH].encode()
+    except (MemoryError, RecursionError):
+        return False, b"Code is too large or too deeply nested to compile"
+    return True, marshal.dumps(compiled)
+
+@lru_cache(maxsize=1)
+def _sandbox_magic() -> Optional[bytes]:
+    """Bytecode magic number of the interpreter used inside the sandbox"""
+    try:
+        out = subprocess.run(
+            [settings.JUDGE_PYTHON, "-c",
+             "import importlib.util, sys; sys.stdout.buffer.write(importlib.util.MAGIC_NUMBER)"],
+            capture_output=True, timeout=10, check=True
+        )
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.warning(f"Could not query {settings.JUDGE_PYTHON} for its bytecode version: {e}")
+        return None
+    return out.stdout
+
+def _to_pyc(marshalled: bytes, source_size: int) -> bytes:
+    # sourceless .pyc header: magic, flags (0 = timestamp based), mtime, source size
+    return (
+        importlib.util.MAGIC_NUMBER
+        + (0).to_bytes(4, "little")
+        + (0).to_bytes(4, "little")
+        + (source_size & 0xFFFFFFFF).to_bytes(4, "little")
+        + marshalled
+    )
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.COMPILE_WORKERS,
+                mp_context=multiprocessing.get_context("forkserver"),
+                initializer=_limit_resources,
+            )
+        return _pool
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            # compiles already queued still finish (or fail as BrokenProcessPool);
+            # cancelling them would cancel other submissions' precompile() awaits
+            _pool.shutdown(wait=False)
+            _pool = None
+
+async def precompile(code: str) -> CompileResult:
+    """Compile a submission outside the sandbox.
+
+    If the compile workers misbehave (timeout, crash) the source is passed on
+    unchanged and the sandbox decides, so this stage can only ever save work.
+    """
+    try:
+        future = asyncio.wrap_future(_get_pool().submit(_compile, code))
+        ok, payload = await asyncio.wait_for(future, settings.COMPILE_TIMEOUT)
+    except (asyncio.TimeoutError, BrokenProcessPool) as e:
+        logger.warning(f"Pre-compilation failed ({type(e).__name__}), judging from source")
+        _reset_pool()
+        return CompileResult(ok=True)
+    except asyncio.CancelledError:
+        # only the judge cancelling this task stops it; a compile the pool
+        # dropped is just a failed compile
+        if asyncio.current_task().cancelling():
+            raise
+        logger.warning("Pre-compilation was cancelled by the compile pool, judging from source")
+        return CompileResult(ok=True)
+
+    if not ok:
+        return CompileResult(ok=False, error=payload.decode())
+
+    # bytecode is only usable by an interpreter with the same magic number
+    # (asked once per process, in a thread since it starts an interpreter)
+    if await asyncio.to_thread(_sandbox_magic) != importlib.util.MAGIC_NUMBER:
+        return CompileResult(ok=True)
+    return CompileResult(ok=True, bytecode=_to_pyc(payload, len(code.encode())))
@@ -0,0 +1,177 @@
+from app.core.config import settings
+from app.core.comparator import Comparator, get_comparator
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Optional, Tuple
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+import tomllib
+
+logger = logging.getLogger(__name__)
+
+PROBLEM_FILE = "run.py"
+# optional per-problem judge settings, e.g. [compare] mode = "float"
+CONFIG_FILE = "judge.toml"
+
+@dataclass
+class TestCase:
+    name: str
+    path: Path
+    # input bytes, kept in memory unless larger than PROBLEM_CACHE_MAX_INLINE
+    input: Optional[bytes]
+    # expected output, already stripped of surrounding whitespace; None if missing
+    expected: Optional[bytes]
+
+@dataclass
+class ProblemAssets:
+    path: Path
+    harness: Optional[bytes]
+    test_cases: List[TestCase]
+    config: dict
+    comparator: Comparator
+    # run all cases in one interpreter with the batch harness
+    batch: bool
+    # content hash of harness, inputs and expected outputs
+    version: str
+    size: int
+    signature: Tuple = field(repr=False)
+    checked_at: float = 0.0
+
+def _natural_key(name: str):
+    """Sort key so that 2.txt comes before 10.txt"""
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", name)]
+
+def _watched_files(path: Path, names: List[str]) -> List[Path]:
+    return (
+        [path / PROBLEM_FILE, path / CONFIG_FILE]
+        + [path / "test_cases" / name for name in names]
+        + [path / "expected" / name for name in names]
+    )
+
+def _signature(path: Path, names: List[str]) -> Optional[Tuple]:
+    """Cheap change detector: mtimes of the problem directories (catch added or
+    removed files) plus mtime and size of every known file (catch edits)"""
+    sig = []
+    for p in [path, path / "test_cases", path / "expected"] + _watched_files(path, names):
+        try:
+            st = os.stat(p)
+        except FileNotFoundError:
+            sig.append(None)
+            continue
+        sig.append((st.st_mtime_ns, st.st_size))
+    return tuple(sig)
+
+def _load(path: Path) -> ProblemAssets:
+    test_dir = path / "test_cases"
+    if not test_dir.is_dir():
+        raise FileNotFoundError(f"Test cases directory not found: {test_dir}")
+
+    names = sorted(
+        (entry.name for entry in os.scandir(test_dir) if entry.is_file()),
+        key=_natural_key
+    )
+    # take the signature first so an edit during loading triggers another reload
+    signature = _signature(path, names)
+
+    digest = hashlib.sha256()
+    size = 0
+
+    harness_path = path / PROBLEM_FILE
+    harness = harness_path.read_bytes() if harness_path.exists() else None
+    if harness is not None:
+        digest.update(harness)
+        size += len(harness)
+
+    config_path = path / CONFIG_FILE
+    config = {}
+    if config_path.exists():
+        raw = config_path.read_bytes()
+        config = tomllib.loads(raw.decode("utf-8"))
+        digest.update(raw)
+    comparator = get_comparator(config.get("compare", {}))
+    harness_mode = config.get("harness", {}).get("mode", "single")
+    if harness_mode not in ("single", "batch"):
+        raise ValueError(f"Unknown harness mode: {harness_mode}")
+
+    test_cases = []
+    for name in names:
+        data = (test_dir / name).read_bytes()
+        digest.update(name.encode() + b"\0" + data + b"\0")
+
+        try:
+            expected = (path / "expected" / name).read_bytes().strip()
+            digest.update(expected + b"\0")
+        except FileNotFoundError:
+            expected = None
+
+        inline = data if len(data) <= settings.PROBLEM_CACHE_MAX_INLINE else None
+        size += len(inline or b"") + len(expected or b"")
+        test_cases.append(TestCase(name, test_dir / name, inline, expected))
+
+    return ProblemAssets(
+        path=path,
+        harness=harness,
+        test_cases=test_cases,
+        config=config,
+        comparator=comparator,
+        batch=harness_mode == "batch",
+        version=digest.hexdigest(),
+        size=size,
+        signature=signature,
+    )
+
+class ProblemCache:
+    """LRU cache of problem assets (harness, test inputs, expected outputs).
+
+    Entries are revalidated against file mtimes at most every
+    PROBLEM_CACHE_CHECK_INTERVAL seconds, so edits under problems/ are picked
+    up without a restart while the judge hot path does no directory scans.
+    """
+
+    def __init__(self, max_bytes: int, check_interval: float):
+        self.max_bytes = max_bytes
+        self.check_interval = check_interval
+        self._entries: "OrderedDict[Path, ProblemAssets]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, problem_path) -> ProblemAssets:
+        key = Path(problem_path).resolve()
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                self._entries.move_to_end(key)
+                if now - entry.checked_at < self.check_interval:
+                    return entry
+
+        if entry and _signature(key, [tc.name for tc in entry.test_cases]) == entry.signature:
+            entry.checked_at = now
+            return entry
+
+        fresh = _load(key)
+        fresh.checked_at = now
+        if entry and fresh.version != entry.version:
+            logger.info(f"Problem assets changed on disk, reloaded {key}")
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old:
+                self._size -= old.size
+            self._entries[key] = fresh
+            self._size += fresh.size
+
+            # evict least recently used problems, but always keep the newest one
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted.size
+        return fresh
+
+# this is the GLOBAL instance
+problem_cache = ProblemCache(settings.PROBLEM_CACHE_MAX_BYTES, settings.PROBLEM_CACHE_CHECK_INTERVAL)
@@ -0,0 +1,457 @@
+from app.core.config import settings
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List, Optional, Dict, Sequence, Type, Union
+import asyncio
+import fcntl
+import logging
+import math
+import os
+import resource
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# ioctl request for a copy-on-write clone (reflink) on btrfs/xfs
+FICLONE = 0x40049409
+
+class BoxPoolTimeout(Exception):
+    """Raised when no sandbox box could be leased in time"""
+
+class BoxPool:
+    """Hands out isolate box IDs so that concurrent judge runs never share a box.
+
+    Within a process a condition variable tracks the free IDs; across processes
+    every leased box additionally holds an exclusive flock on its lock file, so
+    several API/judge processes can share the same configured range.
+    """
+
+    # how often a waiting lease re-checks boxes held by other processes
+    RETRY_INTERVAL = 0.05
+
+    def __init__(self, first_id: int, count: int, lock_dir: Path):
+        if count < 1:
+            raise ValueError("box pool needs at least one box")
+        self.first_id = first_id
+        self.count = count
+        self.lock_dir = Path(lock_dir)
+        self._free: List[int] = list(range(first_id, first_id + count))
+        self._lock_files: Dict[int, int] = {}
+        self._cond = threading.Condition()
+
+    @property
+    def in_use(self) -> int:
+        """Number of boxes currently leased by this process"""
+        with self._cond:
+            return self.count - len(self._free)
+
+    def _try_lock(self, box_id: int) -> bool:
+        self.lock_dir.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.lock_dir / f"box-{box_id}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._lock_files[box_id] = fd
+        return True
+
+    def acquire(self, timeout: Optional[float] = None) -> int:
+        """Lease a free box ID, waiting up to `timeout` seconds (forever if None)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                for box_id in list(self._free):
+                    if self._try_lock(box_id):
+                        self._free.remove(box_id)
+                        return box_id
+
+                wait = self.RETRY_INTERVAL
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise BoxPoolTimeout(f"no free sandbox box after {timeout}s")
+                    wait = min(wait, remaining)
+                self._cond.wait(wait)
+
+    def release(self, box_id: int):
+        """Return a leased box ID to the pool"""
+        with self._cond:
+            fd = self._lock_files.pop(box_id, None)
+            if fd is None:
+                return
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+            self._free.append(box_id)
+            self._cond.notify()
+
+    async def acquire_async(self, timeout: Optional[float] = None) -> int:
+        """acquire() for coroutines: waits without blocking the event loop"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                return self.acquire(timeout=0)
+            except BoxPoolTimeout:
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise BoxPoolTimeout(f"no free sandbox box after {timeout}s") from None
+            await asyncio.sleep(self.RETRY_INTERVAL)
+
+#~~~ FILE STAGING ~~~#
+# Files are moved in and out of a box with direct file I/O instead of
+# spawning cp/touch for every file.
+
+def _reflink(src: Path, dst: Path) -> bool:
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            return True
+        except OSError:
+            return False
+
+def stage_file(src: Path, dst: Path):
+    """Place `src` at `dst` inside a box as cheaply as possible.
+
+    Never a hardlink: the box is handed to the sandboxed program, which could
+    then rewrite the original through the shared inode. A reflink shares only
+    the data blocks (copy-on-write); where that is unsupported, a plain copy.
+    """
+    try:
+        os.unlink(dst)
+    except FileNotFoundError:
+        pass
+
+    if not _reflink(src, dst):
+        shutil.copyfile(src, dst)
+
+def write_file(dst: Path, data: Union[str, bytes] = ""):
+    """Create (or truncate) a file inside a box with the given contents"""
+    if isinstance(data, bytes):
+        with open(dst, "wb") as f:
+            f.write(data)
+    else:
+        with open(dst, "w", encoding="utf-8") as f:
+            f.write(data)
+
+@contextmanager
+def scratch_dir(prefix: str) -> Iterator[Path]:
+    """Private scratch directory for one judge run, removed afterwards unless
+    JUDGE_KEEP_ARTIFACTS is set"""
+    settings.JUDGE_SCRATCH_DIR.mkdir(parents=True, exist_ok=True)
+    path = Path(tempfile.mkdtemp(prefix=prefix, dir=settings.JUDGE_SCRATCH_DIR))
+    try:
+        yield path
+    finally:
+        if settings.JUDGE_KEEP_ARTIFACTS:
+            logger.info(f"Kept judge artifacts in {path}")
+        else:
+            shutil.rmtree(path, ignore_errors=True)
+
+#~~~ SANDBOX BACKENDS ~~~#
+# The judge only talks to a box through the Sandbox interface, so the isolate
+# binary can be swapped for the local stand-in below on machines without root.
+# Both backends write the same isolate-style meta file for every run.
+
+class Sandbox:
+    """One leased box of a sandbox backend.
+
+    init() creates an empty box, files are staged into it by name, run()
+    executes a command under limits and writes a meta file, collect() gives
+    the path of a file left in the box and cleanup() removes the box.
+    init, run and cleanup are coroutines; staging and collecting are plain
+    file operations.
+    """
+
+    name = ""
+
+    def __init__(self, box_id: int):
+        self.box_id = box_id
+
+    @classmethod
+    def check(cls) -> Optional[str]:
+        """Why this backend cannot be used here, or None if it can"""
+        return None
+
+    @property
+    def path(self) -> Path:
+        """Working directory of the box"""
+        raise NotImplementedError
+
+    async def init(self):
+        raise NotImplementedError
+
+    def stage(self, name: str, data: Union[str, bytes] = ""):
+        """Create (or truncate) a file in the box with the given contents"""
+        write_file(self.path / name, data)
+
+    def stage_file(self, name: str, src: Path):
+        """Place a file from outside the box at `name`"""
+        stage_file(src, self.path / name)
+
+    def stage_dir(self, name: str):
+        (self.path / name).mkdir()
+
+    def collect(self, name: str) -> Path:
+        """Path of a file the program left in the box"""
+        return self.path / name
+
+    async def run(self, argv: Sequence[str], *, meta: Path, time_limit: float, mem_limit: int,
+            wall_limit: Optional[float] = None, processes: int = 1,
+            stdin: Optional[str] = None, stdout: Optional[str] = None,
+            stderr: Optional[str] = None) -> bool:
+        """Run `argv` inside the box with a CPU time limit in seconds and a
+        memory limit in KB; stdin/stdout/stderr name files in the box.
+
+        Returns True if the program exited cleanly within its limits. Details
+        are written to `meta` in isolate's key:value format.
+        """
+        raise NotImplementedError
+
+    async def cleanup(self):
+        raise NotImplementedError
+
+class IsolateSandbox(Sandbox):
+    """Boxes managed by the isolate binary (needs root set up)"""
+
+    name = "isolate"
+
+    @classmethod
+    def check(cls) -> Optional[str]:
+        if shutil.which("isolate") is None:
+            return "isolate not installed"
+        return None
+
+    @property
+    def path(self) -> Path:
+        return settings.get_box_path(self.box_id)
+
+    async def _isolate(self, *args: str) -> int:
+        proc = await asyncio.create_subprocess_exec(
+            'isolate', f"--box-id={self.box_id}", *args,
+            stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL,
+        )
+        return await proc.wait()
+
+    async def init(self):
+        await self.cleanup()
+        await self._isolate('--init')
+
+    async def run(self, argv, *, meta, time_limit, mem_limit, wall_limit=None, processes=1,
+                  stdin=None, stdout=None, stderr=None) -> bool:
+        command = [
+            f'--processes={processes}',
+            f'--time={time_limit}',
+            f'--mem={mem_limit}',
+            f'--meta={meta}',
+        ]
+        if wall_limit is not None:
+            command.append(f'--wall-time={wall_limit}')
+        if stdin is not None:
+            command.append(f'--stdin=./{stdin}')
+        if stdout is not None:
+            command.append(f'--stdout=./{stdout}')
+        if stderr is not None:
+            command.append(f'--stderr=./{stderr}')
+        command += ['--run', '--', *argv]
+
+        return await self._isolate(*command) == 0
+
+    async def cleanup(self):
+        await self._isolate('--cleanup')
+
+def _cpu_time(pid: int) -> float:
+    """CPU seconds used so far by a running process"""
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            fields = f.read().rsplit(b")", 1)[1].split()
+    except (OSError, IndexError):
+        return 0.0
+    # utime and stime are fields 14 and 15, counted from the pid
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+def _peak_rss(pid: int) -> int:
+    """Peak resident set size in KB of a running process since its exec"""
+    try:
+        with open(f"/proc/{pid}/status", "rb") as f:
+            for line in f:
+                if line.startswith(b"VmHWM:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return 0
+
+def _user_tasks(uid: int) -> int:
+    """Processes and threads of `uid`, as RLIMIT_NPROC counts them"""
+    tasks = 0
+    for entry in os.scandir("/proc"):
+        if not entry.name.isdigit():
+            continue
+        try:
+            if entry.stat().st_uid != uid:
+                continue
+            with open(f"/proc/{entry.name}/stat", "rb") as f:
+                # num_threads is field 20, counted from the pid
+                tasks += int(f.read().rsplit(b")", 1)[1].split()[17])
+        except (OSError, ValueError, IndexError):
+            pass  # exited meanwhile
+    return tasks
+
+class LocalSandbox(Sandbox):
+    """Stand-in for isolate that only needs an unprivileged Linux user.
+
+    The program runs as a plain subprocess in its own session with rlimits on
+    address space, CPU time and processes, and in fresh user/network/IPC
+    namespaces where the kernel allows it. CPU time is also watched from
+    outside so limits below a second are enforced like isolate does.
+
+    The program is forked from the judge, and the kernel carries the judge's
+    memory over into the program's maximum RSS, so max-rss is instead the
+    highest VmHWM seen while polling (0 for a program that ends before the
+    first look).
+
+    RLIMIT_NPROC counts every process and thread of the judge's user, so the
+    program may have the user's current count plus room for its own and for
+    every other box; it only stops runaway forking. Root ignores it entirely.
+    This is NOT a security boundary: the program can read anything the judge
+    user can. It exists so the judge can be run, profiled and tuned anywhere.
+    """
+
+    name = "local"
+
+    # how often a running program's CPU time and memory are checked
+    POLL_INTERVAL = 0.002
+    # most processes a run asks for (the batch harness and one case)
+    MAX_BOX_PROCESSES = 2
+    NAMESPACES = os.CLONE_NEWUSER | os.CLONE_NEWNET | os.CLONE_NEWIPC | os.CLONE_NEWUTS
+
+    @property
+    def path(self) -> Path:
+        return settings.LOCAL_SANDBOX_ROOT / str(self.box_id) / "box"
+
+    async def init(self):
+        await self.cleanup()
+        self.path.mkdir(parents=True)
+
+    @classmethod
+    def _limit(cls, time_limit: float, mem_limit: int, nproc: int):
+        # runs in the child between fork and exec
+        memory = mem_limit * 1024
+        cpu = math.ceil(time_limit) + 1
+        resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+        # backstop only: the parent kills the program at the exact limit
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))
+        resource.setrlimit(resource.RLIMIT_NPROC, (nproc, nproc))
+        resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+
+        try:
+            os.unshare(cls.NAMESPACES)
+        except OSError:
+            # e.g. unprivileged user namespaces disabled; run without them
+            pass
+
+    async def run(self, argv, *, meta, time_limit, mem_limit, wall_limit=None, processes=1,
+                  stdin=None, stdout=None, stderr=None) -> bool:
+        # the child is reaped with wait4 for its rusage, which asyncio's own
+        # subprocess support does not expose, so it is supervised in a thread
+        return await asyncio.to_thread(self._run, argv, meta, time_limit, mem_limit,
+                                       wall_limit, processes, stdin, stdout, stderr)
+
+    def _run(self, argv, meta, time_limit, mem_limit, wall_limit, processes,
+             stdin, stdout, stderr) -> bool:
+        # isolate has no wall limit by default; here a sleeping program
+        # must not hang the judge, so one is always derived from the CPU limit
+        if wall_limit is None:
+            wall_limit = time_limit * 2 + 1
+
+        def box_file(name: Optional[str], mode: str):
+            if name is None:
+                return open(os.devnull, mode)
+            return open(self.path / name, mode)
+
+        # the processes already running (this judge's included) plus this
+        # run's own, and room for the other boxes to start theirs meanwhile
+        nproc = (_user_tasks(os.getuid()) + processes
+                 + (settings.ISOLATE_BOX_COUNT - 1) * self.MAX_BOX_PROCESSES)
+
+        with box_file(stdin, "rb") as fin, box_file(stdout, "wb") as fout, box_file(stderr, "wb") as ferr:
+            start = time.monotonic()
+            proc = subprocess.Popen(
+                list(argv), cwd=self.path, stdin=fin, stdout=fout, stderr=ferr,
+                env={"PATH": "/usr/bin:/bin"}, start_new_session=True,
+                preexec_fn=lambda: self._limit(time_limit, mem_limit, nproc),
+            )
+
+            timed_out = False
+            peak_rss = 0
+            while True:
+                # Popen returns after the exec, so this is the program's own memory
+                peak_rss = max(peak_rss, _peak_rss(proc.pid))
+                pid, wait_status, usage = os.wait4(proc.pid, os.WNOHANG)
+                if pid:
+                    break
+                if (_cpu_time(proc.pid) > time_limit
+                        or time.monotonic() - start > wall_limit):
+                    timed_out = True
+                    try:
+                        os.killpg(proc.pid, signal.SIGKILL)
+                    except ProcessLookupError:
+                        pass
+                    pid, wait_status, usage = os.wait4(proc.pid, 0)
+                    break
+                time.sleep(self.POLL_INTERVAL)
+            wall = time.monotonic() - start
+            # already reaped by wait4; keep Popen from waiting again
+            proc.returncode = os.waitstatus_to_exitcode(wait_status)
+
+        cpu = usage.ru_utime + usage.ru_stime
+        info = {
+            "time": f"{cpu:.3f}",
+            "time-wall": f"{wall:.3f}",
+            "max-rss": str(peak_rss),
+        }
+        if os.WIFSIGNALED(wait_status):
+            info["exitsig"] = str(os.WTERMSIG(wait_status))
+        else:
+            info["exitcode"] = str(os.WEXITSTATUS(wait_status))
+
+        if timed_out or cpu > time_limit or (os.WIFSIGNALED(wait_status)
+                                             and os.WTERMSIG(wait_status) == signal.SIGXCPU):
+            info["status"] = "TO"
+            info["message"] = "Time limit exceeded" if cpu > time_limit else "Time limit exceeded (wall clock)"
+            info["killed"] = "1"
+        elif os.WIFSIGNALED(wait_status):
+            info["status"] = "SG"
+            info["message"] = f"Caught fatal signal {os.WTERMSIG(wait_status)}"
+        elif os.WEXITSTATUS(wait_status) != 0:
+            info["status"] = "RE"
+            info["message"] = f"Exited with error status {os.WEXITSTATUS(wait_status)}"
+
+        with open(meta, "w", encoding="utf-8") as f:
+            f.write("".join(f"{key}:{value}\n" for key, value in info.items()))
+        return "status" not in info
+
+    async def cleanup(self):
+        await asyncio.to_thread(shutil.rmtree, self.path.parent, ignore_errors=True)
+
+SANDBOX_BACKENDS: Dict[str, Type[Sandbox]] = {
+    IsolateSandbox.name: IsolateSandbox,
+    LocalSandbox.name: LocalSandbox,
+}
+
+def sandbox_backend() -> Type[Sandbox]:
+    """Sandbox class selected by SANDBOX_BACKEND"""
+    try:
+        return SANDBOX_BACKENDS[settings.SANDBOX_BACKEND]
+    except KeyError:
+        raise ValueError(f"Unknown sandbox backend: {settings.SANDBOX_BACKEND}") from None
+
+# this is the GLOBAL instance shared by every judge run in the process
+box_pool = BoxPool(
+    settings.ISOLATE_FIRST_BOX_ID,
+    settings.ISOLATE_BOX_COUNT,
+    settings.BOX_LOCK_DIR,
+)
@@ -0,0 +1,130 @@
+from sqlmodel import Session, select
+from app.core.config import settings
+from app.models import Submission, SubmissionStatus, SubmissionTestResult
+from sqlalchemy import delete
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+import hashlib
+import threading
+
+# Verdicts that depend on timing or on the judge itself are always re-judged
+UNCACHEABLE = {SubmissionStatus.PENDING, SubmissionStatus.TIME_LIMIT, SubmissionStatus.INTERNAL_ERR}
+
+@dataclass
+class CachedVerdict:
+    submission_id: int
+    status: SubmissionStatus
+    score: int
+    result: Optional[str]
+
+# bumped whenever normalize_code changes, so hashes stored by an older
+# normalization never match code it would now tell apart
+NORMALIZATION_VERSION = "2"
+
+def normalize_code(code: str) -> str:
+    """Normalize only what cannot change what the code does: CRLF line endings
+    and newlines at the end of the file. Whitespace within lines is kept, since
+    it matters in string literals and after a line-continuation backslash."""
+    code = code.replace("\r\n", "\n")
+    stripped = code.rstrip("\n")
+    # a trailing backslash continues onto the next line, so the newline after
+    # it decides whether the code compiles at all
+    if stripped.endswith("\\"):
+        return code
+    return stripped
+
+def code_hash(code: str) -> str:
+    normalized = f"{NORMALIZATION_VERSION}:{normalize_code(code)}"
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+class VerdictCache:
+    """Size-bounded LRU of verdicts keyed by (problem, problem version, code hash).
+
+    Judged submissions store their code hash and problem version, so a miss
+    falls back to the submissions table; this also shares verdicts produced by
+    judge workers in other processes. When a problem's test data changes its
+    version changes, and the old entries for that problem are dropped.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[int, str, str], CachedVerdict]" = OrderedDict()
+        self._versions: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def _check_version(self, problem_id: int, version: str):
+        if self._versions.get(problem_id) == version:
+            return
+        self._versions[problem_id] = version
+        for key in [key for key in self._entries if key[0] == problem_id and key[1] != version]:
+            del self._entries[key]
+
+    def get(self, problem_id: int, version: str, digest: str) -> Optional[CachedVerdict]:
+        with self._lock:
+            self._check_version(problem_id, version)
+            key = (problem_id, version, digest)
+            verdict = self._entries.get(key)
+            if verdict:
+                self._entries.move_to_end(key)
+            return verdict
+
+    def put(self, problem_id: int, version: str, digest: str, verdict: CachedVerdict):
+        if verdict.status in UNCACHEABLE:
+            return
+        with self._lock:
+            self._check_version(problem_id, version)
+            self._entries[(problem_id, version, digest)] = verdict
+            self._entries.move_to_end((problem_id, version, digest))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def lookup(self, session: Session, problem_id: int, version: str, digest: str) -> Optional[CachedVerdict]:
+        """Cached verdict for this code and problem version, checking the
+        submissions table on a miss"""
+        verdict = self.get(problem_id, version, digest)
+        if verdict:
+            return verdict
+
+        previous = session.exec(
+            select(Submission)
+            .where(
+                Submission.problem_id == problem_id,
+                Submission.problem_version == version,
+                Submission.code_hash == digest,
+                Submission.status.not_in(UNCACHEABLE),
+            )
+            .order_by(Submission.submission_id.desc())
+            .limit(1)
+        ).first()
+        if not previous:
+            return None
+
+        verdict = CachedVerdict(previous.submission_id, previous.status, previous.score, previous.result)
+        self.put(problem_id, version, digest, verdict)
+        return verdict
+
+def copy_test_results(session: Session, source_id: int, target_id: int):
+    """Give `target_id` the per-test results of the submission its verdict was
+    taken from, replacing any of its own (added to the session, not committed)"""
+    session.exec(delete(SubmissionTestResult).where(SubmissionTestResult.submission_id == target_id))
+    source = session.exec(
+        select(SubmissionTestResult)
+        .where(SubmissionTestResult.submission_id == source_id)
+        .order_by(SubmissionTestResult.test_index)
+    ).all()
+    session.add_all([
+        SubmissionTestResult(
+            submission_id=target_id,
+            test_index=result.test_index,
+            test_name=result.test_name,
+            status=result.status,
+            cpu_time=result.cpu_time,
+            wall_time=result.wall_time,
+            max_rss=result.max_rss
+        )
+        for result in source
+    ])
+
+# this is the GLOBAL instance
+verdict_cache = VerdictCache(settings.VERDICT_CACHE_SIZE)
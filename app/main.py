@@ -1,9 +1,15 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+import asyncio
+import time
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.core.database import engine, create_db_and_tables
+from app.core.config import settings
+from app.core.leaderboard import leaderboard_service
+from app.core.leaderboard_pubsub import leaderboard_pubsub
+from app.core.metrics import HTTP_REQUEST_SECONDS
 
-from app.api.endpoints import auth, problems, submissions, judge, websocket, leaderboard
+from app.api.endpoints import auth, problems, submissions, judge, websocket, leaderboard, metrics
 
 from app.models import User, Problem, Submission  
 from scripts.init_db import create_initial_users, create_initial_problems
@@ -24,6 +30,20 @@ app.include_router(submissions.router, prefix="/submissions", tags=["submissions
 app.include_router(judge.router, prefix="/judge", tags=["judge"])
 app.include_router(websocket.router, tags=["websocket"])
 app.include_router(leaderboard.router, prefix="/leaderboard", tags=["leaderboard"])
+app.include_router(metrics.router, tags=["metrics"])
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    # label by router (its tag) rather than by URL to keep the label set small
+    route = request.scope.get("route")
+    router = route.tags[0] if route is not None and getattr(route, "tags", None) else "other"
+    HTTP_REQUEST_SECONDS.observe(
+        time.perf_counter() - start,
+        router=router, method=request.method, status=response.status_code
+    )
+    return response
 
 @app.on_event("startup")
 def on_startup():
@@ -31,6 +51,25 @@ def on_startup():
     create_initial_users()
     create_initial_problems()
 
+@app.on_event("startup")
+async def start_leaderboard_watcher():
+    await asyncio.to_thread(leaderboard_service.load)
+    # keep a reference so the task is not garbage collected
+    app.state.leaderboard_watcher = asyncio.create_task(
+        leaderboard_service.watch_scores(settings.LEADERBOARD_POLL_INTERVAL)
+    )
+    app.state.leaderboard_broadcaster = asyncio.create_task(leaderboard_service.scheduler.run())
+    app.state.leaderboard_listener = asyncio.create_task(leaderboard_service.listen(leaderboard_pubsub))
+
+@app.on_event("startup")
+async def start_metrics_flusher():
+    # under several API processes, each one's metrics reach /metrics through METRICS_DIR
+    app.state.metrics_flusher = asyncio.create_task(metrics.flush_snapshots(settings.METRICS_FLUSH_INTERVAL))
+
+@app.on_event("shutdown")
+def write_final_metrics():
+    metrics.write_snapshot()
+
 @app.get("/")
 def read_root():
     return {"message": "ACN project API test"}
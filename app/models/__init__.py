@@ -1,4 +1,5 @@
 from sqlmodel import Field, SQLModel, Relationship
+from sqlalchemy import Index, UniqueConstraint, text
 from typing import Optional, List
 from datetime import datetime
 from enum import Enum
@@ -10,6 +11,7 @@ class SubmissionStatus(str, Enum):
     MEM_LIMIT = "MLE"
     TIME_LIMIT = "TLE"  # Value is "TLE", not "TIME_LIMIT"
     RUNTIME_ERR = "RUNTIME_ERR"
+    COMPILE_ERR = "COMPILE_ERR"
     INTERNAL_ERR = "INTERNAL_ERR"
 
 class User(SQLModel, table=True):
@@ -41,10 +43,21 @@ class Submission(SQLModel, table=True):
     score: int = Field(default=0)
     result: Optional[str] = Field(default=None, nullable=True)
     submitted_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+    # what was judged: normalized code hash and problem assets version (see app/core/verdict_cache.py)
+    code_hash: Optional[str] = Field(default=None, index=True, nullable=True)
+    problem_version: Optional[str] = Field(default=None, nullable=True)
+    # judge queue bookkeeping (see app/core/judge_queue.py)
+    queued_at: Optional[datetime] = Field(default=None, index=True, nullable=True)
+    lease_owner: Optional[str] = Field(default=None, nullable=True)
+    lease_expires_at: Optional[datetime] = Field(default=None, nullable=True)
+    attempts: int = Field(default=0)
+    # timeline of the last judge run as compact JSON (see StageTimings in app/core/judge.py)
+    trace: Optional[str] = Field(default=None, nullable=True)
     __tablename__ = "submissions"
 
     user: User = Relationship(back_populates="submissions")
     problem: Problem = Relationship(back_populates="submissions")
+    test_results: List["SubmissionTestResult"] = Relationship(back_populates="submission")
 
 class UserScore(SQLModel, table=True):
     user_score_id: Optional[int] = Field(default=None, primary_key=True)
@@ -53,6 +66,33 @@ class UserScore(SQLModel, table=True):
     best_score: int = Field(default=0)
     last_updated: datetime = Field(default_factory=datetime.utcnow, nullable=False)
     __tablename__ = "user_scores"
+    # one row per (user, problem), the conflict target of update_user_score's upsert
+    __table_args__ = (UniqueConstraint("user_id", "problem_id", name="uq_user_scores_user_problem"),)
 
     user: User = Relationship(back_populates="scores")
-    problem: Problem = Relationship(back_populates="scores")
\ No newline at end of file
+    problem: Problem = Relationship(back_populates="scores")
+
+class UserTotal(SQLModel, table=True):
+    """Per-user leaderboard aggregates, kept up to date by update_user_score
+    in the same transaction as the UserScore change (repair with
+    scripts/repair_user_totals.py)"""
+    user_id: int = Field(foreign_key="users.user_id", primary_key=True)
+    total_score: int = Field(default=0, nullable=False)
+    problems_solved: int = Field(default=0, nullable=False)
+    last_updated: datetime = Field(default_factory=datetime.utcnow, index=True, nullable=False)
+    __tablename__ = "user_totals"
+    # ranking order, so the leaderboard is an index scan
+    __table_args__ = (Index("ix_user_totals_rank", text("total_score DESC"), text("user_id")),)
+
+class SubmissionTestResult(SQLModel, table=True):
+    test_result_id: Optional[int] = Field(default=None, primary_key=True)
+    submission_id: int = Field(foreign_key="submissions.submission_id", index=True, nullable=False)
+    test_index: int = Field(nullable=False)  # position in test order, starting at 0
+    test_name: str = Field(nullable=False)
+    status: str = Field(nullable=False)      # AC, WA, TO, MLE, RE, XX (see problems/README.md)
+    cpu_time: float = Field(default=0)       # seconds
+    wall_time: float = Field(default=0)      # seconds
+    max_rss: int = Field(default=0)          # KB
+    __tablename__ = "submission_test_results"
+
+    submission: Submission = Relationship(back_populates="test_results")
\ No newline at end of file
@@ -0,0 +1,168 @@
+"""
+Judge worker: claims queued submissions and runs them through the judge.
+
+Runs separately from the API so judging never competes with request handling:
+
+    uv run python -m app.worker --processes 4
+"""
+from sqlmodel import Session
+from app.core.config import settings
+from app.core.database import engine
+from app.core import judge_queue
+from app.core.judge import run_judge, StageTimings
+from app.core.metrics import registry, JUDGES_IN_FLIGHT, JUDGE_SECONDS, BOX_POOL_IN_USE
+from app.core.sandbox import box_pool
+from datetime import datetime, timezone
+from typing import Optional, Set, Tuple
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+
+logger = logging.getLogger("judge-worker")
+
+def _claim(worker_id: str) -> Optional[Tuple[int, int, str, int, datetime]]:
+    """Lease the next submission; (id, problem id, code, attempt, queued at) or None"""
+    with Session(engine) as session:
+        submission = judge_queue.claim(session, worker_id)
+        if not submission:
+            judge_queue.expire_exhausted(session)
+            return None
+        return (submission.submission_id, submission.problem_id, submission.code,
+                submission.attempts, submission.queued_at)
+
+async def _judge(worker_id: str, submission_id: int, problem_id: int, code: str, timings: StageTimings):
+    JUDGES_IN_FLIGHT.inc()
+    start = time.perf_counter()
+    with Session(engine) as session:
+        try:
+            await run_judge(
+                submission_id,
+                str(settings.get_problem_path(problem_id)),
+                code,
+                session,
+                timings,
+                worker_id
+            )
+            await asyncio.to_thread(judge_queue.complete, session, submission_id, worker_id, timings.compact())
+        except Exception as e:
+            logger.exception(f"Judging submission {submission_id} failed")
+            await asyncio.to_thread(session.rollback)
+            await asyncio.to_thread(judge_queue.fail, session, submission_id, worker_id, str(e), timings.compact())
+        finally:
+            JUDGES_IN_FLIGHT.dec()
+            JUDGE_SECONDS.observe(time.perf_counter() - start)
+
+def _write_metrics():
+    BOX_POOL_IN_USE.set(box_pool.in_use)
+    try:
+        registry.write_snapshot(settings.METRICS_DIR, "worker")
+    except OSError as e:
+        logger.warning(f"Could not write metrics snapshot: {e}")
+
+async def _flush_metrics(interval: float):
+    """Hand this worker's metrics to the API's /metrics endpoint every `interval` seconds"""
+    while True:
+        _write_metrics()
+        await asyncio.sleep(interval)
+
+async def run_worker(poll_interval: float, concurrency: int):
+    """Claim and judge up to `concurrency` submissions at a time until
+    SIGINT/SIGTERM; submissions in progress are always finished before the
+    worker exits"""
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    stopping = asyncio.Event()
+
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGTERM, stopping.set)
+    loop.add_signal_handler(signal.SIGINT, stopping.set)
+
+    slots = asyncio.Semaphore(concurrency)
+    in_flight: Set[asyncio.Task] = set()
+    flusher = asyncio.create_task(_flush_metrics(settings.METRICS_FLUSH_INTERVAL))
+
+    logger.info(f"Judge worker {worker_id} started ({concurrency} concurrent judges)")
+    while not stopping.is_set():
+        await slots.acquire()
+        if stopping.is_set():
+            slots.release()
+            break
+
+        claim_start = time.time()
+        claimed = await asyncio.to_thread(_claim, worker_id)
+        claim_end = time.time()
+        if not claimed:
+            slots.release()
+            try:
+                await asyncio.wait_for(stopping.wait(), poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        submission_id, problem_id, code, attempt, queued_at = claimed
+        logger.info(f"Worker {worker_id} claimed submission {submission_id} (attempt {attempt})")
+
+        # the trace starts when the submission was queued (queued_at is naive UTC)
+        queued = queued_at.replace(tzinfo=timezone.utc).timestamp()
+        timings = StageTimings(origin=queued)
+        timings.add_span("queue", queued, claim_start - queued)
+        timings.add_span("claim", claim_start, claim_end - claim_start)
+
+        task = asyncio.create_task(_judge(worker_id, submission_id, problem_id, code, timings))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+        task.add_done_callback(lambda _: slots.release())
+
+    if in_flight:
+        logger.info(f"Judge worker {worker_id} finishing {len(in_flight)} submissions")
+        await asyncio.gather(*in_flight, return_exceptions=True)
+    flusher.cancel()
+    _write_metrics()
+    logger.info(f"Judge worker {worker_id} stopped")
+
+def _child_main(poll_interval: float, concurrency: int):
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_worker(poll_interval, concurrency))
+
+def main():
+    parser = argparse.ArgumentParser(prog="judge-worker", description="Run judge worker processes")
+    parser.add_argument("--processes", type=int, default=settings.JUDGE_WORKER_PROCESSES,
+                        help="number of worker processes to run")
+    parser.add_argument("--poll-interval", type=float, default=settings.JUDGE_POLL_INTERVAL,
+                        help="seconds to wait when the queue is empty")
+    parser.add_argument("--concurrency", type=int, default=settings.JUDGE_CONCURRENCY,
+                        help="submissions judged at once by each process")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    if args.processes <= 1:
+        asyncio.run(run_worker(args.poll_interval, args.concurrency))
+        return
+
+    # spawn (not fork) so every worker builds its own DB connection pool
+    ctx = multiprocessing.get_context("spawn")
+    children = [
+        ctx.Process(target=_child_main, args=(args.poll_interval, args.concurrency), name=f"judge-worker-{i}")
+        for i in range(args.processes)
+    ]
+    for child in children:
+        child.start()
+
+    def forward(signum, frame):
+        for child in children:
+            if child.is_alive():
+                os.kill(child.pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+
+    for child in children:
+        child.join()
+
+if __name__ == "__main__":
+    main()
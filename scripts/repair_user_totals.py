@@ -0,0 +1,53 @@
+from sqlmodel import Session, select, func
+from sqlalchemy import literal, text, update
+from sqlalchemy.dialects.postgresql import insert
+from app.core.database import engine
+from app.models import UserScore, UserTotal
+from datetime import datetime
+
+
+def repair_user_totals():
+    """Recompute user_totals from user_scores and fix rows that drifted"""
+    with Session(engine) as session:
+        # Writers add to user_totals after changing user_scores, so while the
+        # table is locked every committed score is counted here and every
+        # score committed later adds its delta on top of the repaired total
+        session.exec(text("LOCK TABLE user_totals IN EXCLUSIVE MODE"))
+
+        now = datetime.utcnow()
+        table = UserTotal.__table__
+        expected = select(
+            UserScore.user_id,
+            func.sum(UserScore.best_score),
+            func.count().filter(UserScore.best_score > 0),
+            literal(now)
+        ).group_by(UserScore.user_id)
+        stmt = insert(table).from_select(
+            ["user_id", "total_score", "problems_solved", "last_updated"], expected
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.user_id],
+            set_={
+                "total_score": stmt.excluded.total_score,
+                "problems_solved": stmt.excluded.problems_solved,
+                "last_updated": stmt.excluded.last_updated
+            },
+            where=(table.c.total_score != stmt.excluded.total_score)
+            | (table.c.problems_solved != stmt.excluded.problems_solved)
+        )
+        fixed = session.exec(stmt).rowcount
+
+        # totals left for users without any scores
+        fixed += session.exec(
+            update(UserTotal)
+            .where(UserTotal.user_id.not_in(select(UserScore.user_id)))
+            .where((UserTotal.total_score != 0) | (UserTotal.problems_solved != 0))
+            .values(total_score=0, problems_solved=0, last_updated=now)
+        ).rowcount
+
+        session.commit()
+        print(f"{fixed} user totals repaired")
+
+
+if __name__ == "__main__":
+    repair_user_totals()
@@ -26,7 +26,7 @@ def verify_problem_structure(problem_num: int):
     print(f"✅ Problem directory exists")
     
     # Check required subdirectories
-    required_dirs = ['test_cases', 'expected', 'output', 'error', 'meta']
+    required_dirs = ['test_cases', 'expected']
     all_dirs_exist = True
     
     for dir_name in required_dirs: